@@ -0,0 +1,130 @@
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from constants import PATH_ASSETS, PATH_COMMON
+
+"""Suffix indexes over the asset trees, so asset strings resolve without rescanning."""
+
+_PATH = None  # Trie key holding the first path ending at a node
+
+
+def _clean(path: str) -> str:
+    # Cross-platform compatibility, becuase Windows is 💩
+    return path.replace("\\", "/").rstrip("/")
+
+
+class AssetTree:
+    """
+    Every file and directory below a root, indexed by reversed path so that
+    a suffix lookup costs one step per character of the asset string.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._trie: dict = {}
+        self._files: Dict[str, List[str]] = {}
+
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+            files = sorted(os.path.join(dirpath, f) for f in filenames)
+            self._files[dirpath] = files
+            paths.extend(files)
+            paths.extend(os.path.join(dirpath, d) for d in dirnames)
+
+        # Same precedence as a sorted scan: the smallest matching path wins
+        for path in sorted(paths):
+            self._insert(path)
+
+    def _insert(self, path: str) -> None:
+        node = self._trie
+        node.setdefault(_PATH, path)
+
+        for char in reversed(_clean(path)):
+            node = node.setdefault(char, {})
+            node.setdefault(_PATH, path)
+
+    def find(self, asset: str) -> Optional[str]:
+        """Return the first path ending with the asset string, if any."""
+        node = self._trie
+
+        for char in reversed(_clean(asset)):
+            node = node.get(char)
+            if node is None:
+                return None
+
+        return node.get(_PATH)
+
+    def files(self, path: str) -> Optional[List[str]]:
+        """Files directly inside a directory of this tree, None if not a directory."""
+        if path in self._files:
+            return list(self._files[path])
+
+        return None
+
+    def directories(self) -> List[str]:
+        """The root and every directory below it."""
+        return sorted(self._files)
+
+    def all_files(self) -> List[str]:
+        return sorted(f for files in self._files.values() for f in files)
+
+
+@lru_cache(maxsize=None)
+def get_asset_tree(root: str) -> AssetTree:
+    """Walk a tree once per process, later lookups reuse the index."""
+    return AssetTree(root)
+
+
+class AssetIndex:
+    """
+    Resolves asset strings for one assets directory, falling back to the
+    common assets. Shared by the loader and the validator.
+    """
+
+    def __init__(self, assets_dir: str) -> None:
+        path = os.path.join(PATH_ASSETS, assets_dir)
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Path {path} does not exist")
+
+        self.trees = [get_asset_tree(path), get_asset_tree(PATH_COMMON)]
+
+    def to_path(self, asset: str) -> str:
+        """
+        Convert an asset string to a path.
+
+        Examples:
+            - "woof.mp3"            -> "assets/sfx/woof.mp3".
+            - "phases/woof_sounds/" -> "assets/phases/woof_sounds/".
+            - "idontexist"          -> FileNotFoundError.
+        """
+
+        for tree in self.trees:
+            path = tree.find(asset)
+            if path is not None:
+                return path
+
+        raise FileNotFoundError(f"Asset {asset} not found")
+
+    def files(self, asset: str) -> List[str]:
+        """The files an asset string refers to, a directory expands to its files."""
+        path = self.to_path(asset)
+
+        for tree in self.trees:
+            files = tree.files(path)
+            if files is not None:
+                return files
+
+        return [path]
+
+
+@lru_cache(maxsize=None)
+def get_asset_index(assets_dir: str) -> AssetIndex:
+    return AssetIndex(assets_dir)
+
+
+def refresh_asset_indexes() -> None:
+    """Forget every walked tree, so files added or removed since are seen."""
+    get_asset_tree.cache_clear()
+    get_asset_index.cache_clear()
@@ -0,0 +1,284 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Protocol,
+    Set,
+    Tuple,
+)
+
+
+class Loadable(Protocol):
+    name: str
+
+    @property
+    def source_bytes(self) -> int: ...
+
+    def load(self) -> None: ...
+
+
+class LoadCancelled(Exception):
+    pass
+
+
+class LoadProgress(NamedTuple):
+    """Items and source bytes loaded out of those queued so far."""
+
+    done: int
+    total: int
+    bytes_done: int
+    bytes_total: int
+    latest: str
+    eta: Optional[float]
+    """Seconds left at the rate so far, None until something loaded."""
+    error: Optional[str]
+    """The first failure, as "name: error"."""
+
+
+class AssetLoader:
+    """
+    Loads assets on background threads, most urgent first.
+
+    Priorities can be raised at any time, e.g. when the current phase changes,
+    and wait() blocks only until the requested asset is loaded. on_done is
+    called whenever everything added so far has been loaded or has failed,
+    and on_progress after every item, from the loading thread.
+
+    prepare, if set, is called with each item on its loading thread right
+    after load(), and the item only counts as loaded once it returns.
+
+    A failed item doesn't stop the others. Waiting for it raises its error,
+    and progress() reports it. cancel() stops the threads once their current
+    item is done.
+    """
+
+    URGENT = 0
+    NEIGHBOUR = 1
+    KEYED = 2
+    REST = 3
+
+    def __init__(
+        self, threads: int = 1, on_done: Optional[Callable[[], None]] = None
+    ) -> None:
+        self.latest_load = ""
+        self.loaded_count = 0
+        self.threads = threads
+        self.on_done = on_done
+        self.on_progress: Optional[Callable[[], None]] = None
+        self.prepare: Optional[Callable[[Loadable], None]] = None
+        self._heap: List[Tuple[int, int, Loadable]] = []
+        self._priorities: Dict[int, int] = {}
+        self._loaded: Dict[int, bool] = {}
+        self._loading: Set[int] = set()
+        self._errors: Dict[int, BaseException] = {}
+        self._error: Optional[str] = None
+        self._sizes: Dict[int, int] = {}
+        self._bytes_loaded = 0
+        self._started_at = 0.0
+        self._cancelled = False
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+
+    def add(self, items: Iterable[Loadable], priority: int = REST) -> None:
+        with self._condition:
+            for item in items:
+                self._track(item)
+                self._push(item, priority)
+
+            self._condition.notify_all()
+
+    def track(self, items: Iterable[Loadable]) -> None:
+        """Mark items as not loaded without queueing them, prioritize() does."""
+        with self._condition:
+            for item in items:
+                self._track(item)
+
+    def prioritize(self, items: Iterable[Optional[Loadable]], priority: int) -> None:
+        """Move items up the queue, lowering a priority is a no-op."""
+        self.add((item for item in items if item is not None), priority)
+
+    def unload(self, item: Loadable) -> None:
+        """Mark a loaded item as unloaded, it's loaded again once prioritized."""
+        with self._condition:
+            if self._loaded.get(id(item)):
+                self._loaded[id(item)] = False
+                self._priorities.pop(id(item), None)
+
+    def forget(self, items: Iterable[Loadable]) -> None:
+        """Stop tracking items, queued ones are skipped instead of loaded."""
+        with self._condition:
+            for item in items:
+                self._loaded.pop(id(item), None)
+                self._priorities.pop(id(item), None)
+                self._errors.pop(id(item), None)
+                self._sizes.pop(id(item), None)
+
+            self._condition.notify_all()
+
+    def start(self) -> None:
+        self._started_at = time.perf_counter()
+        for _ in range(self.threads):
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def cancel(self) -> None:
+        """Stop loading, waiting for an item that isn't loaded raises."""
+        with self._condition:
+            self._cancelled = True
+            self._heap.clear()
+            self._condition.notify_all()
+
+    def is_loaded(self, item: Loadable) -> bool:
+        return self._loaded.get(id(item), True)
+
+    def is_done(self) -> bool:
+        with self._condition:
+            return self._is_done()
+
+    def wait(self, item: Loadable) -> None:
+        """Block until the item is loaded, loading it next if needed."""
+        if self.is_loaded(item):
+            return
+
+        self.prioritize([item], self.URGENT)
+
+        with self._condition:
+            while not self._loaded[id(item)]:
+                if id(item) in self._errors:
+                    raise self._errors[id(item)]
+                if self._cancelled:
+                    raise LoadCancelled(item.name)
+
+                self._condition.wait()
+
+    def progress(self) -> LoadProgress:
+        with self._condition:
+            # Tracked items count once queued, loading, loaded or failed
+            counted = [
+                i
+                for i, loaded in self._loaded.items()
+                if loaded
+                or i in self._priorities
+                or i in self._loading
+                or i in self._errors
+            ]
+            # Failed items are finished too, they won't be loaded
+            done = [i for i in counted if self._loaded[i] or i in self._errors]
+            bytes_done = sum(self._sizes.get(i, 0) for i in done)
+            bytes_total = sum(self._sizes.get(i, 0) for i in counted)
+
+            eta = None
+            elapsed = time.perf_counter() - self._started_at
+            if self._bytes_loaded and self._started_at:
+                rate = self._bytes_loaded / elapsed
+                eta = (bytes_total - bytes_done) / rate
+
+            return LoadProgress(
+                done=len(done),
+                total=len(counted),
+                bytes_done=bytes_done,
+                bytes_total=bytes_total,
+                latest=self.latest_load,
+                eta=eta,
+                error=self._error,
+            )
+
+    def _track(self, item: Loadable) -> None:
+        if id(item) not in self._loaded:
+            self._loaded[id(item)] = False
+            self._sizes[id(item)] = item.source_bytes
+
+    def _is_done(self) -> bool:
+        return all(loaded or i in self._errors for i, loaded in self._loaded.items())
+
+    def _push(self, item: Loadable, priority: int) -> None:
+        if self._loaded[id(item)] or id(item) in self._loading:
+            return
+        if id(item) in self._errors:
+            return
+
+        if priority >= self._priorities.get(id(item), self.REST + 1):
+            return
+
+        # Superseded entries are skipped when popped
+        self._priorities[id(item)] = priority
+        heapq.heappush(self._heap, (priority, next(self._order), item))
+
+    def _next_item(self) -> Optional[Loadable]:
+        """Pop the most urgent item, waiting for more work when idle."""
+        with self._condition:
+            while True:
+                while not self._heap and not self._cancelled:
+                    self._condition.wait()
+
+                if self._cancelled:
+                    return None
+
+                priority, _, item = heapq.heappop(self._heap)
+
+                if self._loaded.get(id(item), True) or id(item) in self._loading:
+                    continue
+                if priority != self._priorities.get(id(item)):
+                    continue
+
+                self._loading.add(id(item))
+                self.latest_load = item.name
+                return item
+
+    def _run(self) -> None:
+        while True:
+            item = self._next_item()
+            if item is None:
+                return
+
+            try:
+                item.load()
+                if self.prepare is not None:
+                    self.prepare(item)
+            except Exception as e:
+                self._failed(item, e)
+                continue
+
+            with self._condition:
+                # Forgotten while loading, e.g. removed by a reload
+                if id(item) in self._loaded:
+                    self._loaded[id(item)] = True
+                self._loading.discard(id(item))
+                self._priorities.pop(id(item), None)
+                self._bytes_loaded += self._sizes.get(id(item), 0)
+                self.loaded_count += 1
+                self._condition.notify_all()
+                done = self._is_done()
+
+            self._notify(done)
+
+    def _failed(self, item: Loadable, error: Exception) -> None:
+        with self._condition:
+            self._loading.discard(id(item))
+            self._priorities.pop(id(item), None)
+
+            # Loads cut short by cancel() aren't failures
+            if self._cancelled or id(item) not in self._loaded:
+                self._condition.notify_all()
+                return
+
+            self._errors[id(item)] = error
+            if self._error is None:
+                self._error = f"{item.name}: {error}"
+
+            self._condition.notify_all()
+            done = self._is_done()
+
+        self._notify(done)
+
+    def _notify(self, done: bool) -> None:
+        if self.on_progress is not None:
+            self.on_progress()
+        if done and self.on_done is not None:
+            self.on_done()
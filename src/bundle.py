@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import shutil
+from typing import Dict, List
+
+from asset_index import get_asset_index
+from config_cop import patrol_config
+from dataobjects.config_schema import ConfigSchema
+from sources import BUNDLE_ALIGN, BUNDLE_MAGIC, BUNDLE_PREAMBLE, data_start
+from util import generate_title_str
+
+"""Packs a config and every asset it uses into one file, read with --bundle."""
+
+BUNDLE_VERSION = 1
+
+
+def pack(config_path: str, output: str) -> None:
+    """
+    Validate a config and write it to output, with every asset string it
+    uses resolved and every file they resolve to appended in loading order,
+    each starting on a page boundary.
+    """
+    config = patrol_config(config_path)
+    index = get_asset_index(config.metadata.assets_dir)
+
+    assets: Dict[str, dict] = {}
+    for asset in _assets_in_loading_order(config):
+        if asset not in assets:
+            assets[asset] = {"path": index.to_path(asset), "files": index.files(asset)}
+
+    members: Dict[str, dict] = {}
+    offset = 0
+    for asset in assets.values():
+        for path in asset["files"] + [asset["path"]]:
+            if path in members or not os.path.isfile(path):
+                continue
+
+            length = os.path.getsize(path)
+            members[path] = {
+                "offset": offset,
+                "length": length,
+                "format": os.path.splitext(path)[1].lstrip(".").lower(),
+            }
+            offset += -(-length // BUNDLE_ALIGN) * BUNDLE_ALIGN
+
+    header = json.dumps(
+        {
+            "version": BUNDLE_VERSION,
+            "config": config.model_dump(),
+            "assets": assets,
+            "members": members,
+        }
+    ).encode()
+
+    temp = f"{output}.tmp"
+    with open(temp, "wb") as f:
+        f.write(BUNDLE_PREAMBLE.pack(BUNDLE_MAGIC, len(header)))
+        f.write(header)
+        f.write(b"\0" * (data_start(len(header)) - f.tell()))
+
+        start = f.tell()
+        for path, member in members.items():
+            f.write(b"\0" * (start + member["offset"] - f.tell()))
+            with open(path, "rb") as data:
+                shutil.copyfileobj(data, f, 1024 * 1024)
+
+    os.replace(temp, output)
+
+    print(generate_title_str(f"Packed {config.metadata.name}"))
+    print(f"{len(members)} files, {os.path.getsize(output) / 2**20:.1f} MB")
+    print(f"Play it with `python src/phusic.py --bundle {output}`")
+
+
+def _assets_in_loading_order(config: ConfigSchema) -> List[str]:
+    """Font, start phase, key-bound phases, sfx, then the other phases."""
+    start = [p for p in config.phases if p.unique_id == config.start_phase]
+    keyed = [p for p in config.phases if p.key is not None]
+
+    assets = [config.font]
+    for phase in start + keyed:
+        assets += [phase.img] + phase.soundtracks
+    assets += [sfx.audio for sfx in config.sfx]
+    for phase in config.phases:
+        assets += [phase.img] + phase.soundtracks
+
+    return assets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pack a config and its assets into one file, run from the "
+        "repository root."
+    )
+    parser.add_argument("config", type=str, help="Path to configuration file")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        type=str,
+        help="Path of the bundle, the config's name with .phusic by default",
+    )
+    args = parser.parse_args()
+
+    name = os.path.splitext(os.path.basename(args.config))[0]
+    pack(args.config, args.output or f"{name}.phusic")
@@ -1,16 +1,25 @@
+import argparse
+import hashlib
+import json
 import os
 import pprint
 import re
+from typing import Dict, List, Optional, Tuple
 
 from pydantic import ValidationError
+from tabulate import tabulate
 
+from asset_index import AssetIndex, get_asset_index
 from config_manager import ConfigManager
-from constants import PATH_ASSETS, PATH_CONFIGS
+from constants import PATH_ASSETS, PATH_CACHE, PATH_CONFIGS
 from dataobjects.config_schema import ConfigSchema
+from decoders import AssetProbe, probe_assets
 from util import generate_title_str, get_files_from_path, none_or_whitespace
 
 """Functions to assert the validity of the config files and assets."""
 
+PATH_VALIDATED = os.path.join(PATH_CACHE, "validated.json")
+
 
 def patrol() -> None:
     _assert_valid_filenames()
@@ -18,6 +27,68 @@ def patrol() -> None:
     _assert_non_clashing_assets()
 
 
+def patrol_config(path: str) -> ConfigSchema:
+    """
+    Validate one config, and the names of the assets it can use: its own
+    assets directory and the common assets. Only parsed when neither the
+    config nor those directories changed since it last passed. Returns the
+    parsed config, so callers don't parse it again.
+    """
+    config = ConfigManager.parse_schema(path)
+    index = get_asset_index(config.metadata.assets_dir)
+
+    fingerprint = _fingerprint(path, index)
+    validated = _read_validated()
+    if validated.get(path) == fingerprint:
+        return config
+
+    for tree in index.trees:
+        files = tree.all_files()
+        _assert_valid_filenames(files)
+        _assert_no_duplicate_files(tree.root, files)
+
+    _assert_valid_config(config)
+
+    validated[path] = fingerprint
+    _write_validated(validated)
+    return config
+
+
+def _fingerprint(path: str, index: AssetIndex) -> str:
+    """
+    Changes with the config's content and with any file added, removed or
+    renamed in the asset trees, as those update their directory's mtime.
+    """
+    fingerprint = hashlib.sha1()
+
+    with open(path, "rb") as f:
+        fingerprint.update(f.read())
+
+    for tree in index.trees:
+        for directory in tree.directories():
+            mtime = os.stat(directory).st_mtime_ns
+            fingerprint.update(f"{directory}|{mtime}".encode())
+
+    return fingerprint.hexdigest()
+
+
+def _read_validated() -> Dict[str, str]:
+    try:
+        with open(PATH_VALIDATED) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_validated(validated: Dict[str, str]) -> None:
+    try:
+        os.makedirs(PATH_CACHE, exist_ok=True)
+        with open(PATH_VALIDATED, "w") as f:
+            json.dump(validated, f, indent=2)
+    except OSError:
+        pass
+
+
 def _assert_valid_configs() -> None:
     files = get_files_from_path(PATH_CONFIGS, "json")
     error = False
@@ -43,27 +114,39 @@ def _assert_valid_config(config: ConfigSchema) -> None:
 
     _assert_files_exists(config)
 
+    errors = _phase_errors(config)
+    if errors:
+        raise ValueError(errors[0])
+
+
+def _phase_errors(config: ConfigSchema) -> List[str]:
+    """Every problem with the phases' ids and links."""
+    errors = []
+
     # Ensure unique ids
     unique_ids = [p.unique_id for p in config.phases]
     if len(unique_ids) != len(set(unique_ids)):
-        raise ValueError("Duplicate unique ids")
+        errors.append("Duplicate unique ids")
 
     # Ensure next_phase is valid
     for phase in config.phases:
         if phase.next_phase is not None:
             if phase.next_phase not in unique_ids:
                 msg = f"'{phase.unique_id}' is pointing to a non-existent next phase: {phase.next_phase}"
-                raise ValueError(msg)
+                errors.append(msg)
 
     # Ensure start_phase is valid
     if config.start_phase not in unique_ids:
-        raise ValueError(f"start_phase '{config.start_phase}' is not a valid phase")
+        errors.append(f"start_phase '{config.start_phase}' is not a valid phase")
 
+    return errors
 
-def _assert_valid_filenames() -> None:
-    """Ensure all files have valid names."""
 
-    files = get_files_from_path(PATH_ASSETS, recursive=True)
+def _assert_valid_filenames(files: Optional[List[str]] = None) -> None:
+    """Ensure all files, every asset by default, have valid names."""
+
+    if files is None:
+        files = get_files_from_path(PATH_ASSETS, recursive=True)
 
     error = False
     for f in files:
@@ -80,17 +163,18 @@ def _assert_valid_filenames() -> None:
 def _assert_files_exists(config: ConfigSchema) -> None:
     """Ensure all files in the config exist."""
 
+    index = get_asset_index(config.metadata.assets_dir)
+
     for phase in config.phases:
-        cm = ConfigManager(config)
-        cm._asset_to_path(phase.img)
+        index.to_path(phase.img)
 
         for soundtrack in phase.soundtracks:
-            cm._asset_to_path(soundtrack)
+            index.to_path(soundtrack)
 
     for sfx in config.sfx:
-        cm._asset_to_path(sfx.audio)
+        index.to_path(sfx.audio)
 
-    cm._asset_to_path(config.font)
+    index.to_path(config.font)
 
 
 def _assert_non_clashing_assets() -> None:
@@ -107,12 +191,15 @@ def _assert_non_clashing_assets() -> None:
             _assert_no_duplicate_files(directory_path)
 
 
-def _assert_no_duplicate_files(directory: str) -> None:
+def _assert_no_duplicate_files(
+    directory: str, files: Optional[List[str]] = None
+) -> None:
     """Ensure there are no duplicate files in the directory."""
 
-    files = get_files_from_path(directory, recursive=True)
+    if files is None:
+        files = get_files_from_path(directory, recursive=True)
 
-    found_files = []
+    found_files = set()
     error = False
     clashes = []
 
@@ -123,9 +210,107 @@ def _assert_no_duplicate_files(directory: str) -> None:
             error = True
             clashes.append(path)
 
-        found_files.append(filename)
+        found_files.add(filename)
 
     if error:
         print(generate_title_str("🚨 Clashing files! Exiting 🚨"))
-        pprint(clashes)
+        pprint.pprint(clashes)
         raise ValueError("Clashing file names")
+
+
+def audit(workers: Optional[int] = None) -> None:
+    """
+    Check every config and asset like patrol(), and decode every asset the
+    configs refer to in worker processes. All errors are reported together.
+    """
+    errors: List[str] = []
+
+    # One walk over the assets for names and clashes
+    first_seen: Dict[Tuple[str, str], str] = {}
+    for dirpath, _, filenames in os.walk(PATH_ASSETS, followlinks=True):
+        top = os.path.relpath(dirpath, PATH_ASSETS).split(os.sep)[0]
+
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+
+            if not re.match(r"^[a-z0-9_.]*$", filename):
+                errors.append(f"Invalid file name: {path}")
+
+            clash = first_seen.setdefault((top, filename), path)
+            if clash != path:
+                errors.append(f"Clashing file name: {path} and {clash}")
+
+    # Every config, and what its assets should decode as
+    probes: Dict[str, str] = {}
+    for f in get_files_from_path(PATH_CONFIGS, "json"):
+        try:
+            config = ConfigManager.parse_schema(f)
+            index = get_asset_index(config.metadata.assets_dir)
+        except (ValidationError, FileNotFoundError, ValueError) as e:
+            errors.append(f"{f}: {e}")
+            continue
+
+        errors.extend(f"{f}: {e}" for e in _phase_errors(config))
+
+        references = [("font", config.font)]
+        references += [("sound", sfx.audio) for sfx in config.sfx]
+        for phase in config.phases:
+            references.append(("image", phase.img))
+            references += [("sound", soundtrack) for soundtrack in phase.soundtracks]
+
+        for kind, asset in references:
+            try:
+                probes.update((path, kind) for path in index.files(asset))
+            except FileNotFoundError as e:
+                errors.append(f"{f}: {e}")
+
+    # The game's mixer format, so decoded sizes match what it holds in memory
+    results = probe_assets(probes, (44100, -16, 1), workers)
+    errors.extend(f"Can't decode {r.path}: {r.error}" for r in results if r.error)
+    _print_audit(results)
+
+    if errors:
+        print(generate_title_str(f"🚨 {len(errors)} error(s) 🚨"))
+        print("\n".join(errors))
+        raise ValueError(f"{len(errors)} asset error(s)")
+
+
+def _print_audit(results: List[AssetProbe]) -> None:
+    rows = [
+        (
+            r.kind,
+            r.path,
+            "x".join(map(str, r.size)) if r.size else "",
+            f"{r.seconds:.1f}" if r.seconds else "",
+            f"{r.nbytes / 1024 / 1024:.1f}",
+        )
+        for r in results
+        if not r.error
+    ]
+    total = sum(r.nbytes for r in results) / 1024 / 1024
+
+    print(generate_title_str(f"Decoded {len(rows)} assets, {total:.0f} MB in total"))
+    print(tabulate(rows, ["Kind", "Path", "Size", "Seconds", "MB"], "github"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Validate every config and asset, run from the repository root."
+    )
+    parser.add_argument(
+        "--audit",
+        action="store_true",
+        help="Also decode every referenced asset, reporting all errors together",
+    )
+    parser.add_argument(
+        "--workers",
+        default=None,
+        type=int,
+        help="Processes decoding assets in the audit, one per core by default",
+    )
+    args = parser.parse_args()
+
+    if args.audit:
+        audit(args.workers)
+    else:
+        patrol()
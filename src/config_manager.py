@@ -1,58 +1,231 @@
 import json
-import os
 import random
-import threading
-from typing import List, Optional
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Set, Tuple, Union
 
 import pygame
 
-from constants import PATH_ASSETS, PATH_COMMON
-from dataobjects.config_schema import ConfigSchema
+from asset_index import AssetIndex, get_asset_index
+from asset_loader import AssetLoader, Loadable
 from dataobjects.phase import Phase
 from dataobjects.sfx import Sfx
-from util import get_files_from_path
+from decoders import AssetTiming, DecodePool, Decoder
+from disk_cache import DiskCache
+from phase_graph import PhaseGraph
+from residency import Residency
+from sound_cache import SoundCache
+from sources import Bundle
+from util import generate_title_str
 
+if TYPE_CHECKING:
+    from dataobjects.config_schema import ConfigSchema
 
-class ConfigManager:
-    _latest_load: str = ""
 
-    _phases: Optional[List[Phase]] = None
-    _sfxs: Optional[List[Sfx]] = None
+class Reload(NamedTuple):
+    """What a reload changed, phases and sfx that weren't removed were kept."""
+
+    kept: int
+    added: List[Loadable]
+    removed: List[Loadable]
+    font_changed: bool
 
-    def __init__(self, config: ConfigSchema) -> None:
+
+class ConfigManager:
+    def __init__(
+        self,
+        config: "ConfigSchema",
+        asset_index: Optional[Union[AssetIndex, Bundle]] = None,
+        stream_soundtracks: bool = False,
+        background_size: Optional[Tuple[int, int]] = None,
+        use_disk_cache: bool = False,
+        workers: int = 1,
+        load_report: bool = False,
+        memory_budget: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            asset_index: Resolves asset strings, a mounted bundle loads them
+                from the bundle. The config's assets directory by default.
+            workers: Decoding processes, with 1 everything is decoded in this
+                process. The loader runs one thread per worker.
+            load_report: Print per-asset load timings once loading is done.
+            memory_budget: Bytes of decoded assets to keep, phases far from
+                the current one are unloaded past it. None keeps everything.
+        """
         if config is None:
             raise ValueError("Config is required")
 
         self._config = config
+        self._stream_soundtracks = stream_soundtracks
+        self._background_size = background_size
+        self._load_report = load_report
+        self._memory_budget = memory_budget
+
+        self._decoder = DecodePool(workers) if workers > 1 else Decoder()
+        if use_disk_cache:
+            self._decoder = DiskCache(self._decoder)
+
+        # With a budget, released sounds are dropped instead of kept for reuse
+        sound_cache_bytes = SoundCache.MAX_BYTES if memory_budget is None else 0
+        self._sounds = SoundCache(sound_cache_bytes, decoder=self._decoder)
+        self._asset_index = asset_index or get_asset_index(config.metadata.assets_dir)
+        self.loader = AssetLoader(max(workers, 1), on_done=self._on_loaded)
+        self._phases: Optional[List[Phase]] = None
+        self._sfxs: Optional[List[Sfx]] = None
+        self._phase_graph: Optional[PhaseGraph] = None
+        self._residency: Optional[Residency] = None
 
     def load_assets(self) -> None:
-        for method in [self._load_phases, self._load_sfx]:
-            thread = threading.Thread(target=method)
-            thread.start()
+        """
+        Start loading in the background. The start phase is loaded first,
+        then key-bound phases and sfx, then the rest. Use the residency to
+        raise priorities as the current phase changes. With a memory budget
+        the rest is left to the residency, which only loads what fits.
+        """
+        self._queue(self.get_phases(), self.get_sfx())
+        self.loader.start()
+
+    def reload(self, config: "ConfigSchema", changed: Set[str]) -> Reload:
+        """
+        Switch to a new version of the config while loading. Phase variants
+        and sfx are kept, decoded assets and all, when their files are the
+        same and not among the changed paths. Only the rest is loaded, and
+        the phase graph is rebuilt.
+        """
+        old_phases, old_sfx, old_font = (
+            self.get_phases(),
+            self.get_sfx(),
+            self.get_font(),
+        )
+
+        self._config = config
+        self._asset_index = get_asset_index(config.metadata.assets_dir)
+
+        reusable_phases = {
+            (p.unique_id, p.img_path): p
+            for p in old_phases
+            if p.img_path not in changed and not changed.intersection(p.audio_paths)
+        }
+        reusable_sfx = {
+            (s.name, s.audio_path): s for s in old_sfx if s.audio_path not in changed
+        }
+        self._phases = self._create_phases(reusable_phases)
+        self._sfxs = self._create_sfx(reusable_sfx)
+
+        old = {id(item) for item in old_phases + old_sfx}
+        new = {id(item) for item in self._phases + self._sfxs}
+        added = [
+            item
+            for item in self._unique(self._phases) + self._sfxs
+            if id(item) not in old
+        ]
+        removed = [
+            item for item in self._unique(old_phases) + old_sfx if id(item) not in new
+        ]
+
+        self.loader.forget(removed)
+        self._queue(
+            [p for p in added if isinstance(p, Phase)],
+            [s for s in added if isinstance(s, Sfx)],
+        )
+
+        self._phase_graph = None
+        if self._residency is not None:
+            self._residency.set_graph(self.get_phase_graph())
+
+        font = self.get_font()
+        return Reload(
+            kept=len(new & old),
+            added=added,
+            removed=removed,
+            font_changed=font != old_font or font in changed,
+        )
+
+    def _queue(self, phases: List[Phase], sfx: List[Sfx]) -> None:
+        start_phase = self.get_start_phase()
+
+        self.loader.add([p for p in phases if p is start_phase], AssetLoader.URGENT)
+        self.loader.add([p for p in phases if p.key is not None], AssetLoader.KEYED)
+        self.loader.add(sfx, AssetLoader.KEYED)
+        if self._memory_budget is None:
+            self.loader.add(phases, AssetLoader.REST)
+        else:
+            self.loader.track(phases)
+
+    def get_asset_roots(self) -> List[str]:
+        """The directories assets are resolved from, the config's and common."""
+        return [tree.root for tree in self._asset_index.trees]
 
     def get_font(self) -> str:
         return self._asset_to_path(self._config.font)
 
-    def get_assets(self) -> dict:
-        if not self._loading_complete():
-            raise ValueError("Assets not loaded, use load_assets() first")
+    def get_phases(self) -> List[Phase]:
+        """Every phase variant, assets are decoded by the loader."""
+        if self._phases is None:
+            self._phases = self._create_phases()
 
-        return {"phases": self._phases, "sfx": self._sfxs}
+        return self._phases
 
-    def status(self) -> dict:
-        return {
-            "loading": not self._loading_complete(),
-            "latest_load": self._latest_load,
-        }
+    def get_phase_graph(self) -> PhaseGraph:
+        """The phases linked by next_phase, starting at the start phase."""
+        if self._phase_graph is None:
+            start_phase = self.get_start_phase()
+            self._phase_graph = PhaseGraph(self.get_phases(), start_phase.unique_id)
 
-    def _loading_complete(self) -> bool:
-        return all(asset is not None for asset in [self._phases, self._sfxs])
+        return self._phase_graph
 
-    def _load_phases(self) -> None:
+    def get_residency(self) -> Residency:
+        """Decides which phases stay loaded as the current phase changes."""
+        if self._residency is None:
+            self._residency = Residency(
+                self.get_phase_graph(), self.loader, self._sounds, self._memory_budget
+            )
+
+        return self._residency
+
+    def get_sfx(self) -> List[Sfx]:
+        if self._sfxs is None:
+            self._sfxs = self._create_sfx()
+
+        return self._sfxs
+
+    def get_start_phase(self) -> Phase:
+        for phase in self.get_phases():
+            if phase.unique_id == self._config.start_phase:
+                return phase
+
+        raise ValueError("Start phase not found")
+
+    def get_load_timings(self) -> List[AssetTiming]:
+        """How long each asset took to decode, so far."""
+        return list(self._decoder.timings)
+
+    def cancel(self) -> None:
+        """Stop loading, on quit. Decodes in worker processes are abandoned."""
+        self.loader.cancel()
+        self._decoder.close()
+
+    def _on_loaded(self) -> None:
+        if self._load_report:
+            self._print_load_report()
+
+    def _print_load_report(self) -> None:
+        from tabulate import tabulate
+
+        timings = sorted(self._decoder.timings, key=lambda t: t.seconds, reverse=True)
+        rows = [(t.kind, t.path, t.source, f"{t.seconds * 1000:.1f}") for t in timings]
+        total = sum(t.seconds for t in timings)
+
+        print(generate_title_str(f"Loaded {len(rows)} assets, {total:.2f}s in total"))
+        print(tabulate(rows, ["Kind", "Path", "Source", "ms"], "github"))
+
+    def _create_phases(
+        self, reusable: Optional[Dict[Tuple[str, str], Phase]] = None
+    ) -> List[Phase]:
+        """One phase per image, reusing a variant with the same id and image."""
+        reusable = reusable or {}
         phases = []
 
         for phase in self._config.phases:
-            self._latest_load = phase.name
             phase_instances = []
 
             audio_paths = []
@@ -63,7 +236,16 @@ class ConfigManager:
             img_paths = self._get_files_from_asset(phase.img)
 
             for img in img_paths:
-                audio = random.choice(audio_paths)
+                old = reusable.pop((phase.unique_id, img), None)
+                if old is not None and self._plays(old, audio_paths, phase.playlist):
+                    old.name = phase.name
+                    old.key = phase.key
+                    old.next_phase_id = phase.next_phase
+                    old.duration = phase.duration
+                    phase_instances.append(old)
+                    continue
+
+                audio = audio_paths[0] if phase.playlist else random.choice(audio_paths)
                 phase_instances.append(
                     Phase(
                         phase.unique_id,
@@ -73,6 +255,12 @@ class ConfigManager:
                         key=phase.key,
                         next_phase_id=phase.next_phase,
                         duration=phase.duration,
+                        stream=self._stream_soundtracks,
+                        sounds=self._sounds,
+                        background_size=self._background_size,
+                        decoder=self._decoder,
+                        soundtracks=audio_paths,
+                        playlist=phase.playlist,
                     )
                 )
 
@@ -87,53 +275,54 @@ class ConfigManager:
                 phase_index = i % len(phase)
                 ordered_phases.append(phase[phase_index])
 
-        self._phases = ordered_phases
+        return ordered_phases
 
-    def _load_sfx(self) -> None:
+    def _create_sfx(
+        self, reusable: Optional[Dict[Tuple[str, str], Sfx]] = None
+    ) -> List[Sfx]:
+        reusable = reusable or {}
         sfxs = []
 
         for sfx in self._config.sfx:
             fx_path = self._asset_to_path(sfx.audio)
-            sfxs.append(Sfx(getattr(pygame, sfx.key), fx_path))
 
-        self._sfxs = sfxs
+            old = reusable.pop((sfx.name, fx_path), None)
+            if old is not None:
+                old.key = getattr(pygame, sfx.key)
+                sfxs.append(old)
+                continue
 
-    def _get_files_from_asset(self, asset: str) -> List[str]:
-        return get_files_from_path(self._asset_to_path(asset))
-
-    def _asset_to_path(self, asset: str) -> str:
-        """
-        Convert an asset string to a path.
-
-        Examples:
-            - "woof.mp3"            -> "assets/sfx/woof.mp3".
-            - "phases/woof_sounds/" -> "assets/phases/woof_sounds/".
-            - "idontexist"          -> FileNotFoundError.
-        """
+            sfxs.append(
+                Sfx(getattr(pygame, sfx.key), fx_path, self._sounds, name=sfx.name)
+            )
 
-        path = os.path.join(PATH_ASSETS, self._config.metadata.assets_dir)
+        return sfxs
 
-        if not os.path.exists(path):
-            raise FileNotFoundError(f"Path {path} does not exist")
+    @staticmethod
+    def _plays(phase: Phase, audio_paths: List[str], playlist: Optional[str]) -> bool:
+        """Whether a kept phase can play on: same playlist, or its track is listed."""
+        if playlist is not None or phase.playlist is not None:
+            return phase.playlist == playlist and phase.audio_paths == audio_paths
 
-        assets = get_files_from_path(path, recursive=True, include_dirs=True)
-        common_assets = get_files_from_path(
-            PATH_COMMON, recursive=True, include_dirs=True
-        )
+        return phase.audio_path in audio_paths
 
-        for f in assets + common_assets:
-            # Cross-platform compatibility, becuase Windows is 💩
-            cleaned_f = f.replace("\\", "/").rstrip("/")
-            cleaned_asset = asset.replace("\\", "/").rstrip("/")
+    @staticmethod
+    def _unique(items: List[Loadable]) -> List[Loadable]:
+        """Phases repeat in the phase list, once each and in order."""
+        return list({id(item): item for item in items}.values())
 
-            if cleaned_f.endswith(cleaned_asset):
-                return f
+    def _get_files_from_asset(self, asset: str) -> List[str]:
+        return self._asset_index.files(asset)
 
-        raise FileNotFoundError(f"Asset {asset} not found")
+    def _asset_to_path(self, asset: str) -> str:
+        return self._asset_index.to_path(asset)
 
     @staticmethod
-    def parse_schema(path: str) -> ConfigSchema:
+    def parse_schema(path: str) -> "ConfigSchema":
         """Parse a config schema from a file."""
+        # Imported here, pydantic takes a while and the window opens first
+        from dataobjects.config_schema import ConfigSchema
+
         with open(path) as f:
             data = json.load(f)
 
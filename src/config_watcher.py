@@ -0,0 +1,156 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import pygame
+
+"""Watches a config and its asset trees, posting an event when they change."""
+
+RELOAD_EVENT = pygame.event.custom_type()
+
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+class _Inotify:
+    """Wakes up on changes in a set of directories, Linux only."""
+
+    # IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO,
+    # IN_CREATE, IN_DELETE and IN_DELETE_SELF
+    MASK = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400
+
+    def __init__(self) -> None:
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Inode of every watched directory, a recreated one needs a new watch
+        self._watched: Dict[str, int] = {}
+
+    @classmethod
+    def create(cls) -> Optional["_Inotify"]:
+        try:
+            return cls()
+        except (OSError, AttributeError, TypeError):
+            return None
+
+    def watch(self, directories: List[str]) -> None:
+        """Add watches for the directories that aren't watched yet."""
+        watched = {}
+
+        for directory in directories:
+            try:
+                inode = os.stat(directory).st_ino
+            except OSError:
+                continue
+
+            if self._watched.get(directory) != inode:
+                self._libc.inotify_add_watch(self._fd, directory.encode(), self.MASK)
+            watched[directory] = inode
+
+        # Watches of removed directories are dropped by the kernel
+        self._watched = watched
+
+    def wait(self, timeout: float) -> bool:
+        """Block until something changed or timeout, True if it changed."""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return False
+
+        while True:
+            try:
+                os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return True
+
+
+class ConfigWatcher:
+    """
+    Posts a RELOAD_EVENT, with the changed paths in its changed attribute,
+    whenever the config or a file below one of the roots is added, removed
+    or modified. Uses inotify where available and polls otherwise.
+
+    Changes are reported once they settle, as editors and file managers
+    write in several steps.
+    """
+
+    POLL_SECONDS = 1.0
+    SETTLE_SECONDS = 0.3
+
+    def __init__(self, config_path: str, roots: List[str]) -> None:
+        self.config_path = config_path
+        self.roots = roots
+        self._stopped = threading.Event()
+
+    def start(self) -> "ConfigWatcher":
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        inotify = _Inotify.create()
+        snapshot, directories = self._snapshot()
+        if inotify is not None:
+            inotify.watch(directories)
+
+        while not self._stopped.is_set():
+            if inotify is not None:
+                if not inotify.wait(self.POLL_SECONDS):
+                    continue
+            else:
+                time.sleep(self.POLL_SECONDS)
+
+            # Wait until nothing changed for a moment
+            while inotify is not None and inotify.wait(self.SETTLE_SECONDS):
+                pass
+
+            current, directories = self._snapshot()
+            changed = self._changed(snapshot, current)
+            snapshot = current
+
+            if inotify is not None:
+                inotify.watch(directories)
+
+            if changed:
+                event = pygame.event.Event(RELOAD_EVENT, changed=changed)
+                pygame.event.post(event)
+
+    def _snapshot(self) -> Tuple[Snapshot, List[str]]:
+        """Size and mtime of every watched file, and the directories to watch."""
+        snapshot: Snapshot = {}
+        directories = [os.path.dirname(self.config_path) or "."]
+
+        stat = self._stat(self.config_path)
+        if stat is not None:
+            snapshot[self.config_path] = stat
+
+        for root in self.roots:
+            for dirpath, _, filenames in os.walk(root, followlinks=True):
+                directories.append(dirpath)
+
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    stat = self._stat(path)
+                    if stat is not None:
+                        snapshot[path] = stat
+
+        return snapshot, directories
+
+    @staticmethod
+    def _stat(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        return stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def _changed(before: Snapshot, after: Snapshot) -> Set[str]:
+        paths = before.keys() | after.keys()
+        return {path for path in paths if before.get(path) != after.get(path)}
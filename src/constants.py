@@ -4,3 +4,5 @@ PATH_CONFIGS = "configs"
 PATH_ASSETS = "assets"
 PATH_COMMON = f"{PATH_ASSETS}/_common"
 PATH_CONTROLS = "_controls.txt"
+PATH_CACHE = ".phusic_cache"
+PATH_PROFILE = "phusic_profile.json"
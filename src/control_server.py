@@ -0,0 +1,348 @@
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+import time
+from typing import List, Optional, Set, Tuple
+from urllib.parse import unquote, urlsplit
+
+import pygame
+
+from profiler import percentile
+from util import generate_title_str
+
+"""Remote control over HTTP and WebSocket, for phones and laptops at the table."""
+
+# Actions, and whether they take an argument: a unique id or an sfx name
+ACTIONS = {"next": False, "prev": False, "phase": True, "sfx": True, "fade": False}
+
+_WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Bytes, larger request bodies and WebSocket messages are refused
+MAX_BODY = 64 * 1024
+
+_PAGE = """<!doctype html>
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Phusic</title>
+<style>
+  body { font: 18px sans-serif; margin: 1em; background: #111; color: #eee }
+  button { font: inherit; margin: .2em; padding: .6em 1em }
+  .current { outline: 3px solid #fc0 }
+</style>
+<div id="nav">
+  <button onclick="send('prev')">&larr;</button>
+  <button onclick="send('next')">&rarr;</button>
+  <button id="fade" onclick="send('fade')">Fade</button>
+</div>
+<h3>Phases</h3><div id="phases"></div>
+<h3>Sfx</h3><div id="sfx"></div>
+<script>
+  const ws = new WebSocket(`ws://${location.host}/ws`);
+  const send = (action, arg) => ws.send(JSON.stringify({action, arg}));
+  const buttons = (id, items, action, current) => {
+    const div = document.getElementById(id);
+    div.replaceChildren(...items.map(([arg, label]) => {
+      const b = document.createElement("button");
+      b.textContent = label;
+      b.className = arg === current ? "current" : "";
+      b.onclick = () => send(action, arg);
+      return b;
+    }));
+  };
+  ws.onmessage = (message) => {
+    const state = JSON.parse(message.data);
+    if (!state.phases) return;
+    buttons("phases", state.phases.map(p => [p.unique_id, p.name]), "phase", state.current);
+    buttons("sfx", state.sfx.map(s => [s, s]), "sfx");
+    document.getElementById("fade").textContent = state.fade ? "Fade: on" : "Fade: off";
+  };
+</script>
+"""
+
+
+class ControlServer:
+    """
+    Serves the phase graph and current phase, and takes commands, on its own
+    thread and event loop so the game loop never waits on the network.
+
+        GET  /                   a remote control page
+        GET  /state              the state as JSON
+        POST /<action>[/<arg>]   next, prev, phase/<id>, sfx/<name>, fade
+        GET  /ws                 a WebSocket taking {"action", "arg"}
+                                 messages and pushing the state on changes
+
+    Commands are posted as EVENTs with action, arg and sent_at,
+    the perf_counter() time they arrived. The game publishes its state
+    after handling them and records how long they took to be heard.
+    """
+
+    EVENT = pygame.event.custom_type()
+
+    def __init__(self, port: int, host: str = "127.0.0.1") -> None:
+        self.host = host
+        self.port = port
+        self.latencies: List[float] = []
+
+        self._state: dict = {}
+        self._state_json = b"{}"
+        self._clients: Set[asyncio.StreamWriter] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready = threading.Event()
+        self._start_error: Optional[OSError] = None
+
+    def start(self) -> "ControlServer":
+        threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait()
+
+        if self._start_error is not None:
+            raise self._start_error
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def publish(self, state: dict) -> None:
+        """Share the game's state, pushed to every WebSocket client."""
+        self._state = state
+        self._state_json = json.dumps(state).encode()
+
+        if self._loop is not None and self._clients:
+            self._loop.call_soon_threadsafe(self._broadcast, self._state_json)
+
+    def record(self, sent_at: float) -> None:
+        """A command was heard, sent_at is from its event."""
+        self.latencies.append(time.perf_counter() - sent_at)
+
+    def latency_stats(self) -> dict:
+        samples = sorted(self.latencies)
+        return {
+            "count": len(samples),
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "max_ms": samples[-1] * 1000 if samples else 0.0,
+        }
+
+    def report(self) -> None:
+        stats = self.latency_stats()
+        print(generate_title_str(f"Control server, {stats['count']} commands"))
+        print(
+            f"Command to audio: p50 {stats['p50_ms']:.2f} ms, "
+            f"p95 {stats['p95_ms']:.2f} ms, max {stats['max_ms']:.2f} ms"
+        )
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        try:
+            server = loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port)
+            )
+        except OSError as e:
+            # E.g. the port is taken, raised from start()
+            self._start_error = e
+            self._ready.set()
+            return
+
+        self._loop = loop
+        self.port = server.sockets[0].getsockname()[1]
+        print(f"Control server on http://{self.host}:{self.port}")
+
+        self._ready.set()
+        self._loop.run_forever()
+
+    def _command(self, action: str, arg: Optional[str]) -> Optional[str]:
+        """Post a command to the game, or return why it can't be."""
+        # From WebSocket messages, which can hold any JSON
+        if not isinstance(action, str) or not isinstance(arg, (str, type(None))):
+            return 'Expected {"action": ..., "arg": ...} with strings'
+        if action not in ACTIONS:
+            return f"Unknown action: {action}"
+        if ACTIONS[action] and not arg:
+            return f"{action} needs an argument"
+
+        if action == "phase":
+            ids = [p["unique_id"] for p in self._state.get("phases", [])]
+            if arg not in ids:
+                return f"Unknown phase: {arg}"
+        if action == "sfx" and arg not in self._state.get("sfx", []):
+            return f"Unknown sfx: {arg}"
+
+        event = pygame.event.Event(
+            self.EVENT, action=action, arg=arg, sent_at=time.perf_counter()
+        )
+        pygame.event.post(event)
+        return None
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            method, path, headers = await self._read_request(reader)
+
+            # A bad or cross-site handshake gets an error from _route instead
+            upgrade = headers.get("upgrade", "").lower() == "websocket"
+            handshake = upgrade and "sec-websocket-key" in headers
+            if path == "/ws" and handshake and self._trusted(headers):
+                await self._websocket(reader, writer, headers)
+                return
+
+            status, content_type, body = self._route(method, path, headers)
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, dict]:
+        method, path, _ = (await reader.readline()).decode().split(" ", 2)
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        # Commands are in the path, a body is read and ignored, or refused by
+        # _route when it's too large to bother reading
+        length = int(headers.get("content-length", 0))
+        if length <= MAX_BODY:
+            await reader.readexactly(length)
+        return method, unquote(path.split("?")[0]), headers
+
+    def _route(self, method: str, path: str, headers: dict) -> Tuple[str, str, bytes]:
+        if not self._trusted(headers):
+            error = self._error("Requests from other sites aren't allowed")
+            return "403 Forbidden", "application/json", error
+
+        if int(headers.get("content-length", 0)) > MAX_BODY:
+            error = self._error(f"Request bodies are limited to {MAX_BODY} bytes")
+            return "413 Content Too Large", "application/json", error
+
+        if path == "/ws":
+            error = self._error("Expected a WebSocket upgrade")
+            return "400 Bad Request", "application/json", error
+
+        if method == "GET" and path == "/":
+            return "200 OK", "text/html", _PAGE.encode()
+
+        if method == "GET" and path == "/state":
+            state = dict(self._state, latency=self.latency_stats())
+            return "200 OK", "application/json", json.dumps(state).encode()
+
+        if method == "POST":
+            action, _, arg = path.strip("/").partition("/")
+            error = self._command(action, arg or None)
+            if error is None:
+                return "202 Accepted", "application/json", b'{"ok": true}'
+
+            return "404 Not Found", "application/json", self._error(error)
+
+        return "404 Not Found", "application/json", self._error("Not found")
+
+    @staticmethod
+    def _trusted(headers: dict) -> bool:
+        """
+        Whether a request is from the remote page or a script. Browsers send
+        an Origin with commands and WebSocket handshakes from any page, so a
+        site open at the table could otherwise drive the game.
+        """
+        origin = headers.get("origin")
+        return origin is None or urlsplit(origin).netloc == headers.get("host")
+
+    @staticmethod
+    def _error(message: str) -> bytes:
+        return json.dumps({"ok": False, "error": message}).encode()
+
+    async def _websocket(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        headers: dict,
+    ) -> None:
+        key = headers["sec-websocket-key"] + _WEBSOCKET_GUID
+        accept = base64.b64encode(hashlib.sha1(key.encode()).digest()).decode()
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+        )
+        writer.write(_frame(0x1, self._state_json))
+        self._clients.add(writer)
+
+        try:
+            while True:
+                opcode, payload = await _read_frame(reader)
+
+                if opcode == 0x8:
+                    writer.write(_frame(0x8, payload[:2]))
+                    break
+                if opcode == 0x9:
+                    writer.write(_frame(0xA, payload))
+                if opcode != 0x1:
+                    continue
+
+                try:
+                    message = json.loads(payload)
+                    error = self._command(message.get("action"), message.get("arg"))
+                except (ValueError, AttributeError):
+                    error = 'Expected {"action": ..., "arg": ...}'
+
+                if error is not None:
+                    writer.write(_frame(0x1, self._error(error)))
+        finally:
+            self._clients.discard(writer)
+
+    def _broadcast(self, payload: bytes) -> None:
+        frame = _frame(0x1, payload)
+        for writer in list(self._clients):
+            if writer.is_closing():
+                self._clients.discard(writer)
+            else:
+                writer.write(frame)
+
+
+def _frame(opcode: int, payload: bytes) -> bytes:
+    """An unmasked, unfragmented WebSocket frame, as servers send them."""
+    length = len(payload)
+
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+
+    return header + payload
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Read a client frame, clients always mask their payload."""
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+
+    # Messages are small commands, a huge one closes the connection
+    if length > MAX_BODY:
+        raise ValueError(f"WebSocket frame of {length} bytes")
+
+    mask = await reader.readexactly(4) if second & 0x80 else b"\0\0\0\0"
+    payload = await reader.readexactly(length)
+
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
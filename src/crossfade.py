@@ -0,0 +1,147 @@
+from typing import Callable, List, Optional
+
+import pygame
+
+from dataobjects.phase import Phase
+
+"""Layered blending between phase backgrounds, interruptible at any point."""
+
+
+class Layer:
+    def __init__(self, phase: Phase, start_weight: float) -> None:
+        self.phase = phase
+        # How much of the layer showed when the running fade started
+        self.start_weight = start_weight
+
+
+class Crossfade:
+    """
+    A stack of phases blended together, the top one being faded to.
+
+    A fade starts from whatever blend is showing: over duration seconds the
+    target's weight goes up to 1 from its weight at the start, and every
+    other layer's goes down to 0 from its own. Changing the target halfway
+    through keeps each phase where it was, so nothing jumps. Layers are
+    dropped once they no longer show, and the stack never grows past
+    max_layers, so a frame is at most one copy and max_layers - 1 alpha
+    blits however fast phases are changed.
+    """
+
+    MAX_LAYERS = 3
+
+    def __init__(self, duration: float, max_layers: int = MAX_LAYERS) -> None:
+        self.duration = duration
+        self.max_layers = max(max_layers, 2)
+        self.layers: List[Layer] = []
+        self.started_at = 0.0
+
+    @property
+    def target(self) -> Optional[Phase]:
+        return self.layers[-1].phase if self.layers else None
+
+    @property
+    def is_fading(self) -> bool:
+        return len(self.layers) > 1
+
+    def contains(self, phase: Phase) -> bool:
+        return any(layer.phase is phase for layer in self.layers)
+
+    def reset(self, phase: Phase, now: float) -> List[Phase]:
+        """Show phase right away. Returns the phases no longer shown."""
+        dropped = [layer.phase for layer in self.layers if layer.phase is not phase]
+        self.layers = [Layer(phase, 1.0)]
+        self.started_at = now - self.duration
+        return dropped
+
+    def start(self, phase: Phase, now: float) -> List[Phase]:
+        """Fade to phase from the current blend. Returns the phases no longer shown."""
+        layers: List[Layer] = []
+        dropped = []
+        current = 0.0
+
+        for layer, weight in zip(self.layers, self.weights(now)):
+            if layer.phase is phase:
+                # A phase has one channel, so it's only ever on one layer. One
+                # still fading out goes on top from the weight it's at
+                current = weight
+            elif weight > 0.0:
+                layers.append(Layer(layer.phase, weight))
+            else:
+                dropped.append(layer.phase)
+
+        self.layers = layers + [Layer(phase, current)]
+        self.started_at = now
+
+        while len(self.layers) > self.max_layers:
+            # The least visible layer goes, the new target never does, and
+            # what it showed is shared out to the others in proportion
+            below = [layer.start_weight for layer in self.layers[:-1]]
+            layer = self.layers.pop(below.index(min(below)))
+            dropped.append(layer.phase)
+
+            rest = 1.0 - layer.start_weight
+            for other in self.layers:
+                other.start_weight /= rest
+
+        return dropped + self.update(now)
+
+    def update(self, now: float) -> List[Phase]:
+        """Drop the layers faded out once the fade is over."""
+        if not self.is_fading or self.progress(now) < 1.0:
+            return []
+
+        dropped, self.layers = self.layers[:-1], [Layer(self.target, 1.0)]
+        return [layer.phase for layer in dropped]
+
+    def progress(self, now: float) -> float:
+        """How far through the running fade, from 0 to 1."""
+        if self.duration <= 0:
+            return 1.0
+
+        return min(1.0, max(0.0, (now - self.started_at) / self.duration))
+
+    def weights(self, now: float) -> List[float]:
+        """How much of each layer shows through, these add up to 1."""
+        progress = self.progress(now)
+        weights = [layer.start_weight * (1.0 - progress) for layer in self.layers]
+
+        if weights:
+            target = self.layers[-1].start_weight
+            weights[-1] = target + (1.0 - target) * progress
+
+        return weights
+
+    def alphas(self, now: float) -> List[float]:
+        """
+        Opacity to blit each layer with, bottom to top, so that each one
+        shows by its weight. The lowest layer that shows is opaque.
+        """
+        alphas = []
+        below = 0.0
+
+        for weight in self.weights(now):
+            below += weight
+            alphas.append(weight / below if below > 0.0 else 0.0)
+
+        return alphas
+
+    def draw(
+        self,
+        screen: pygame.Surface,
+        rect: pygame.Rect,
+        now: float,
+        background: Callable[[Phase], pygame.Surface],
+    ) -> None:
+        """
+        Blit the layers bottom to top. background gives a phase's background
+        at rect's size, the cached surfaces are left opaque once a layer is
+        drawn as the bottom one.
+        """
+        for layer, alpha in zip(self.layers, self.alphas(now)):
+            alpha = int(alpha * 255)
+            if alpha == 0:
+                continue
+
+            surface = background(layer.phase)
+            surface.set_alpha(alpha if alpha < 255 else None)
+            screen.blit(surface, rect)
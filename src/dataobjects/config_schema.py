@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel
 
@@ -18,6 +18,10 @@ class PhaseSchema(BaseModel):
     duration: Optional[int] = None
     """Optional, how long the phase should last in seconds"""
 
+    playlist: Optional[Literal["rotate", "shuffle"]] = None
+    """Optional, play every soundtrack in turn, in order or shuffled, instead
+    of looping one picked at random"""
+
 
 class SfxSchema(BaseModel):
     name: str
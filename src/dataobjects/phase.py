@@ -1,7 +1,13 @@
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import pygame
 
+from decoders import Decoder
+from playlist import Playlist
+from sound_cache import SoundCache
+from sources import loadable, source_size
+from streaming_sound import StreamingSound
+
 
 class Phase:
     def __init__(
@@ -13,12 +19,127 @@ class Phase:
         key: Optional[str] = None,
         next_phase_id: Optional[str] = None,
         duration: Optional[int] = None,
+        stream: bool = False,
+        sounds: Optional[SoundCache] = None,
+        background_size: Optional[Tuple[int, int]] = None,
+        decoder: Optional[Decoder] = None,
+        soundtracks: Optional[List[str]] = None,
+        playlist: Optional[str] = None,
     ) -> None:
+        """
+        Args:
+            audio_path: The soundtrack, looped. With a playlist, the first
+                of its soundtracks.
+            soundtracks: Every soundtrack of the phase, played in turn with a
+                playlist.
+            playlist: "rotate" plays them in order and "shuffle" shuffled,
+                None loops audio_path.
+        """
         self.unique_id = unique_id
         self.name = name
         self.audio_path = audio_path
-        self.sound = pygame.mixer.Sound(audio_path)
-        self.background = pygame.image.load(img_path).convert()
+        self.img_path = img_path
         self.key = key
         self.next_phase_id = next_phase_id
         self.duration = duration
+
+        self._stream = stream
+        self._sounds = sounds
+        self._background_size = background_size
+        self._decoder = decoder or Decoder()
+        self.sound = None
+        self.background: Optional[pygame.Surface] = None
+
+        self.playlist = playlist
+        self.audio_paths = soundtracks if playlist else [audio_path]
+        # Kept across unloads, so it goes on from where it was
+        self._playlist = (
+            Playlist(self.audio_paths, playlist, stream, self._decoder, sounds)
+            if playlist
+            else None
+        )
+
+        # The sound may be shared with other phases, so playback is
+        # controlled through the channel it plays on
+        self.channel = None
+
+    def load(self) -> None:
+        """Decode the soundtrack, and the background at its final size."""
+        if self._playlist is not None:
+            self._playlist.load()
+            self.background = self._load_background()
+            self.sound = self._playlist
+            return
+
+        sound = StreamingSound.open(self.audio_path) if self._stream else None
+        if sound is None:
+            sound = (
+                self._sounds.acquire(self.audio_path)
+                if self._sounds
+                else self._decoder.sound(self.audio_path)
+            )
+
+        self.background = self._load_background()
+        self.sound = sound
+
+    def unload(self) -> None:
+        """Stop and drop the decoded assets, load() brings them back."""
+        self.stop()
+
+        if self._sounds and isinstance(self.sound, pygame.mixer.Sound):
+            self._sounds.release(self.sound)
+        if self._playlist is not None:
+            self._playlist.close()
+
+        self.sound = None
+        self.background = None
+
+    @property
+    def source_bytes(self) -> int:
+        """Size of the files it's decoded from."""
+        return source_size(self.audio_path) + source_size(self.img_path)
+
+    @property
+    def nbytes(self) -> int:
+        """Decoded size of the soundtrack and background, 0 until loaded."""
+        if isinstance(self.sound, pygame.mixer.Sound):
+            return memoryview(self.sound).nbytes + self.background_bytes
+
+        playlist = self._playlist.nbytes if self._playlist is not None else 0
+        return playlist + self.background_bytes
+
+    @property
+    def playlist_bytes(self) -> int:
+        """Decoded tracks held by the playlist outside the sound cache."""
+        if self._playlist is None or self._sounds is not None:
+            return 0
+
+        return self._playlist.nbytes
+
+    @property
+    def background_bytes(self) -> int:
+        if self.background is None:
+            return 0
+
+        width, height = self.background.get_size()
+        return width * height * self.background.get_bytesize()
+
+    def _load_background(self) -> pygame.Surface:
+        if self._background_size:
+            return self._decoder.image(self.img_path, self._background_size)
+
+        return pygame.image.load(loadable(self.img_path), self.img_path).convert()
+
+    def play(self, volume: float) -> None:
+        self.stop()
+        self.channel = self.sound.play(-1)
+        self.set_volume(volume)
+
+    def set_volume(self, volume: float) -> None:
+        if self.channel is not None:
+            self.channel.set_volume(volume)
+
+    def stop(self) -> None:
+        if self.channel is not None:
+            self.channel.stop()
+            self.channel = None
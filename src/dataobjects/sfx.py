@@ -1,7 +1,38 @@
+from typing import Optional
+
 import pygame
 
+from sound_cache import SoundCache
+from sources import loadable, source_size
+
 
 class Sfx:
-    def __init__(self, key: int, audio_path: str) -> None:
+    def __init__(
+        self,
+        key: int,
+        audio_path: str,
+        sounds: Optional[SoundCache] = None,
+        name: str = "",
+    ) -> None:
         self.key = key
-        self.sound = pygame.mixer.Sound(audio_path)
+        self.name = name
+        self.audio_path = audio_path
+        self.sound = None
+        self._sounds = sounds
+
+    @property
+    def source_bytes(self) -> int:
+        return source_size(self.audio_path)
+
+    def load(self) -> None:
+        self.sound = (
+            self._sounds.acquire(self.audio_path)
+            if self._sounds
+            else pygame.mixer.Sound(loadable(self.audio_path))
+        )
+
+    def unload(self) -> None:
+        if self._sounds and self.sound is not None:
+            self._sounds.release(self.sound)
+
+        self.sound = None
@@ -0,0 +1,248 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context, shared_memory
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import pygame
+
+from sources import loadable, mount, mounted
+
+"""Decoding of soundtracks and backgrounds, in this process or a process pool."""
+
+# Byte order of the display's 32 bit format, so raw pixels blit as is
+IMAGE_FORMAT = "BGRA"
+
+Size = Tuple[int, int]
+
+
+class AssetTiming(NamedTuple):
+    kind: str
+    path: str
+    seconds: float
+    source: str
+
+
+class AssetProbe(NamedTuple):
+    kind: str
+    path: str
+    size: Optional[Size]
+    seconds: float
+    nbytes: int
+    error: Optional[str]
+
+
+def available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
+def _scaled_pixels(path: str, size: Size) -> bytes:
+    surface = pygame.transform.scale(pygame.image.load(loadable(path), path), size)
+    return pygame.image.tobytes(surface, IMAGE_FORMAT)
+
+
+class Decoder:
+    """
+    Decodes assets in this process.
+
+    sound() and image() return ready to use objects and record a timing per
+    asset. pcm() and pixels() yield the raw buffers, for callers that store
+    them.
+    """
+
+    def __init__(self) -> None:
+        self.timings: List[AssetTiming] = []
+        self._lock = threading.Lock()
+
+    def sound(self, path: str) -> pygame.mixer.Sound:
+        start = time.perf_counter()
+        sound, source = self._sound(path)
+        self._record("sound", path, start, source)
+        return sound
+
+    def image(self, path: str, size: Size) -> pygame.Surface:
+        start = time.perf_counter()
+        surface, source = self._image(path, size)
+        self._record("image", path, start, source)
+        return surface
+
+    @contextmanager
+    def pcm(self, path: str) -> Iterator[bytes]:
+        """Samples at the mixer's format."""
+        yield pygame.mixer.Sound(loadable(path)).get_raw()
+
+    @contextmanager
+    def pixels(self, path: str, size: Size) -> Iterator[bytes]:
+        """Pixels in IMAGE_FORMAT, scaled to size."""
+        yield _scaled_pixels(path, size)
+
+    def close(self) -> None:
+        """Release what decoding holds on to, once done with the decoder."""
+
+    def _sound(self, path: str) -> Tuple[pygame.mixer.Sound, str]:
+        return pygame.mixer.Sound(loadable(path)), "decoded"
+
+    def _image(self, path: str, size: Size) -> Tuple[pygame.Surface, str]:
+        surface = pygame.image.load(loadable(path), path).convert()
+        return pygame.transform.scale(surface, size), "decoded"
+
+    def _record(self, kind: str, path: str, start: float, source: str) -> None:
+        timing = AssetTiming(kind, path, time.perf_counter() - start, source)
+        with self._lock:
+            self.timings.append(timing)
+
+
+def _init_worker(
+    mixer_init: Tuple[int, int, int], bundles: Tuple[str, ...] = ()
+) -> None:
+    # Workers only decode, they must never open the real audio or video device
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pygame.mixer.init(*mixer_init)
+
+    for bundle in bundles:
+        mount(bundle)
+
+
+def _share(data: bytes) -> Tuple[str, int]:
+    """Copy data into a new shared memory block, the caller unlinks it."""
+    shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    shm.buf[: len(data)] = data
+    shm.close()
+    return shm.name, len(data)
+
+
+def _decode_pcm(path: str) -> Tuple[str, int]:
+    return _share(pygame.mixer.Sound(loadable(path)).get_raw())
+
+
+def _decode_pixels(path: str, size: Size) -> Tuple[str, int]:
+    return _share(_scaled_pixels(path, size))
+
+
+def _probe(kind: str, path: str) -> AssetProbe:
+    """Decode an asset fully, to confirm it loads and measure it."""
+    size, seconds, nbytes = None, 0.0, 0
+
+    try:
+        if kind == "sound":
+            sound = pygame.mixer.Sound(path)
+            seconds, nbytes = sound.get_length(), memoryview(sound).nbytes
+        elif kind == "image":
+            size = pygame.image.load(path).get_size()
+            nbytes = size[0] * size[1] * 4
+        elif kind == "font":
+            pygame.font.init()
+            pygame.font.Font(path, 12)
+            nbytes = os.path.getsize(path)
+        else:
+            raise ValueError(f"Unknown asset kind {kind}")
+    except Exception as e:
+        return AssetProbe(kind, path, size, seconds, nbytes, f"{type(e).__name__}: {e}")
+
+    return AssetProbe(kind, path, size, seconds, nbytes, None)
+
+
+def probe_assets(
+    assets: Dict[str, str],
+    mixer_init: Tuple[int, int, int],
+    workers: Optional[int] = None,
+) -> List[AssetProbe]:
+    """Probe every path -> kind in worker processes, one per core by default."""
+    paths = sorted(assets)
+    kinds = [assets[path] for path in paths]
+    workers = workers or available_cores()
+
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(mixer_init,),
+    ) as executor:
+        chunksize = max(1, len(paths) // (workers * 4))
+        return list(executor.map(_probe, kinds, paths, chunksize=chunksize))
+
+
+class DecodePool(Decoder):
+    """
+    Decodes assets in worker processes, one per core by default. Buffers come
+    back through shared memory and are wrapped into sounds and surfaces here.
+
+    The workers are spawned on the first decode and kept until close(), so
+    decodes while playing, like playlist tracks and reloads, don't pay for
+    spawning them again.
+    """
+
+    def __init__(self, workers: Optional[int] = None) -> None:
+        super().__init__()
+        self.workers = workers or available_cores()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._closed = False
+
+    @contextmanager
+    def pcm(self, path: str) -> Iterator[memoryview]:
+        with self._shared(self._submit(_decode_pcm, path)) as buffer:
+            yield buffer
+
+    @contextmanager
+    def pixels(self, path: str, size: Size) -> Iterator[memoryview]:
+        with self._shared(self._submit(_decode_pixels, path, size)) as buffer:
+            yield buffer
+
+    def close(self) -> None:
+        """Stop the workers for good, decodes running or submitted later raise."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._closed = True
+
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _sound(self, path: str) -> Tuple[pygame.mixer.Sound, str]:
+        with self.pcm(path) as buffer:
+            return pygame.mixer.Sound(buffer=buffer), "worker"
+
+    def _image(self, path: str, size: Size) -> Tuple[pygame.Surface, str]:
+        with self.pixels(path, size) as buffer:
+            surface = pygame.image.frombuffer(buffer, size, IMAGE_FORMAT)
+            converted = surface.convert()
+            del surface
+
+        return converted, "worker"
+
+    def _submit(self, fn, *args) -> Tuple[str, int]:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The decode pool is closed")
+
+            if self._executor is None:
+                # Spawned, forking a process with SDL running isn't safe
+                self._executor = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(pygame.mixer.get_init(), tuple(mounted())),
+                )
+
+            # Submitted under the lock, so close() can't shut it down in between
+            future = self._executor.submit(fn, *args)
+
+        return future.result()
+
+    @contextmanager
+    def _shared(self, result: Tuple[str, int]) -> Iterator[memoryview]:
+        name, length = result
+        shm = shared_memory.SharedMemory(name=name)
+        buffer = shm.buf[:length]
+
+        try:
+            yield buffer
+        finally:
+            buffer.release()
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,180 @@
+import hashlib
+import mmap
+import os
+import threading
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, ContextManager, Iterator, Optional, Tuple
+
+import pygame
+
+from constants import PATH_CACHE
+from decoders import IMAGE_FORMAT, Decoder, Size
+from sources import source_key
+
+"""Decoded audio and pre-scaled backgrounds persisted between launches."""
+
+
+class DiskCache(Decoder):
+    """
+    Raw decoded assets stored on disk and memory-mapped on later launches.
+
+    Misses are decoded by the wrapped decoder. Entries are keyed by the
+    source file's path, size and mtime plus the target format, so an edited
+    source or a different mixer format misses the cache and the stale entry
+    is replaced. The least recently used entries are removed once the cache
+    grows past max_bytes.
+    """
+
+    MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+    def __init__(
+        self,
+        decoder: Optional[Decoder] = None,
+        path: str = PATH_CACHE,
+        max_bytes: int = MAX_BYTES,
+    ) -> None:
+        super().__init__()
+        self.decoder = decoder or Decoder()
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    @contextmanager
+    def pcm(self, path: str) -> Iterator[memoryview]:
+        with self._lookup(path, self._pcm_target(), None, self.decoder.pcm) as found:
+            yield found[0]
+
+    @contextmanager
+    def pixels(self, path: str, size: Size) -> Iterator[memoryview]:
+        target = self._pixels_target(size)
+        decode = partial(self.decoder.pixels, size=size)
+
+        with self._lookup(path, target, size[0] * size[1] * 4, decode) as found:
+            yield found[0]
+
+    def close(self) -> None:
+        self.decoder.close()
+
+    def _sound(self, path: str) -> Tuple[pygame.mixer.Sound, str]:
+        # pygame copies the samples into its own chunk, no need to keep the map
+        with self._lookup(path, self._pcm_target(), None, self.decoder.pcm) as found:
+            buffer, source = found
+            return pygame.mixer.Sound(buffer=buffer), source
+
+    def _image(self, path: str, size: Size) -> Tuple[pygame.Surface, str]:
+        buffer = self.get(path, self._pixels_target(size), size[0] * size[1] * 4)
+
+        if buffer is not None:
+            # The surface keeps a reference to the map and reads it in place
+            return pygame.image.frombuffer(buffer, size, IMAGE_FORMAT), "cache"
+
+        with self.pixels(path, size) as buffer:
+            surface = pygame.image.frombuffer(buffer, size, IMAGE_FORMAT)
+            converted = surface.convert()
+            del surface
+
+        return converted, "decoded"
+
+    @contextmanager
+    def _lookup(
+        self,
+        path: str,
+        target: str,
+        length: Optional[int],
+        decode: Callable[[str], ContextManager[memoryview]],
+    ) -> Iterator[Tuple[memoryview, str]]:
+        """Yield (buffer, source) from the cache, decoding and storing on a miss."""
+        buffer = self.get(path, target, length)
+
+        if buffer is None:
+            with decode(path) as decoded:
+                self.put(path, target, decoded)
+                yield decoded, "decoded"
+            return
+
+        view = memoryview(buffer)
+        try:
+            yield view, "cache"
+        finally:
+            view.release()
+            buffer.close()
+
+    @staticmethod
+    def _pcm_target() -> str:
+        return "pcm-{}-{}-{}".format(*pygame.mixer.get_init())
+
+    @staticmethod
+    def _pixels_target(size: Size) -> str:
+        return f"{IMAGE_FORMAT.lower()}-{size[0]}x{size[1]}"
+
+    def get(
+        self, source: str, target: str, length: Optional[int] = None
+    ) -> Optional[mmap.mmap]:
+        """Map the entry for a source and target, None on a miss."""
+        entry = self._entry_path(source, target)
+
+        try:
+            with open(entry, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        if length is not None and len(buffer) != length:
+            buffer.close()
+            self._remove(entry)
+            return None
+
+        # Mark as recently used for eviction
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+
+        return buffer
+
+    def put(self, source: str, target: str, data: bytes) -> None:
+        """Store an entry, replacing older versions of the same source."""
+        if not data:
+            return
+
+        entry = self._entry_path(source, target)
+        prefix = os.path.basename(entry).split("_")[0]
+        temp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, entry)
+
+        with self._lock:
+            for name in os.listdir(self.path):
+                if name.startswith(prefix + "_") and name != os.path.basename(entry):
+                    self._remove(os.path.join(self.path, name))
+
+            self._evict()
+
+    def _entry_path(self, source: str, target: str) -> str:
+        resolved, size, mtime = source_key(source)
+        name = hashlib.sha1(f"{resolved}|{target}".encode())
+        version = hashlib.sha1(f"{size}|{mtime}".encode())
+        filename = f"{name.hexdigest()[:20]}_{version.hexdigest()[:20]}.raw"
+        return os.path.join(self.path, filename)
+
+    def _evict(self) -> None:
+        entries = [e for e in os.scandir(self.path) if e.name.endswith(".raw")]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        total = sum(e.stat().st_size for e in entries)
+
+        for e in entries:
+            if total <= self.max_bytes:
+                return
+
+            total -= e.stat().st_size
+            self._remove(e.path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
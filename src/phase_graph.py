@@ -0,0 +1,69 @@
+from typing import Dict, List, Optional
+
+import pygame
+
+from dataobjects.phase import Phase
+
+"""Phases linked by next_phase, indexed by unique id and key."""
+
+
+class PhaseNode:
+    """
+    A phase in the graph, with every variant of it (one per image). value
+    is the variant shown when the phase is entered.
+    """
+
+    def __init__(self, unique_id: str, variants: List[Phase]) -> None:
+        self.unique_id = unique_id
+        self.variants = variants
+        self.variant = 0
+        self.prev: Optional[PhaseNode] = None
+        self.next: Optional[PhaseNode] = None
+
+    @property
+    def value(self) -> Phase:
+        return self.variants[self.variant]
+
+
+class PhaseGraph:
+    """
+    Every phase node by unique id, with next and prev links resolved once.
+
+    next follows next_phase. prev is the phase a node is first reached from
+    when walking from the start phase, phases off that walk have no prev.
+    keys maps pygame key codes to the phase they jump to.
+    """
+
+    def __init__(self, phases: List[Phase], start_phase_id: str) -> None:
+        self.nodes: Dict[str, PhaseNode] = {}
+
+        variants: Dict[str, List[Phase]] = {}
+        for phase in phases:
+            # Phases with fewer variants are repeated in the list, skip those
+            phase_variants = variants.setdefault(phase.unique_id, [])
+            if phase not in phase_variants:
+                phase_variants.append(phase)
+
+        for unique_id, phase_variants in variants.items():
+            self.nodes[unique_id] = PhaseNode(unique_id, phase_variants)
+
+        for node in self.nodes.values():
+            node.next = self.nodes.get(node.value.next_phase_id)
+
+        self.head = self.nodes[start_phase_id]
+
+        # Walk from the start phase until it loops or ends
+        node, seen = self.head, {self.head.unique_id}
+        while node.next is not None and node.next.unique_id not in seen:
+            node.next.prev = node
+            node = node.next
+            seen.add(node.unique_id)
+
+        self.keys: Dict[int, PhaseNode] = {
+            getattr(pygame, node.value.key): node
+            for node in self.nodes.values()
+            if node.value.key is not None
+        }
+
+    def __getitem__(self, unique_id: str) -> PhaseNode:
+        return self.nodes[unique_id]
@@ -1,138 +1,464 @@
+import time
+
+# Before the other imports, the startup timeline counts them
+STARTED_AT = time.perf_counter()
+
 import argparse
 import math
 import sys
-import time
-from asyncio import Event
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 import pygame
 
 import util as util
-from config_cop import patrol
+from asset_index import refresh_asset_indexes
+from asset_loader import Loadable, LoadProgress
 from config_manager import ConfigManager
-from constants import KEYBIND_FULLSCREEN
-from dataobjects.config_schema import ConfigSchema
-from linked_list import Node
+from config_watcher import RELOAD_EVENT, ConfigWatcher
+from constants import KEYBIND_FULLSCREEN, PATH_PROFILE
+from crossfade import Crossfade
+from dataobjects.phase import Phase
+from dataobjects.sfx import Sfx
+from decoders import available_cores
+from phase_graph import PhaseNode
+from playlist import Playlist
+from profiler import Profiler, StageProfiler, StartupTimeline
+from sources import Bundle, mount
+from streaming_sound import StreamingSound
+from text_cache import TextCache
+
+# Imported where they're used: validating and parsing the config pulls in
+# pydantic, and the control server asyncio, both slow to import
+if TYPE_CHECKING:
+    from control_server import ControlServer
+    from dataobjects.config_schema import ConfigSchema
 
 
 class Game:
-    FPS = 20
     cm: ConfigManager
 
+    # Frame rate ceilings, while fading and otherwise
+    FADE_FPS = 60
+    IDLE_FPS = 10
+
     # Transition
-    TOTAL_FADE_STEPS = 255
     TRANSITION_DURATION_SECONDS = 5
-    FADE_STEPS = TOTAL_FADE_STEPS / float(TRANSITION_DURATION_SECONDS * FPS)
+    MAX_FADE_LAYERS = 3
 
     # Drawing
     FONT_SIZE = 42
     INITIAL_WINDOW_SIZE = (1280, 720)
     LOGICAL_SIZE = (2560, 1440)
-    logical_surface = pygame.Surface(LOGICAL_SIZE)
+
+    # Window events that need the screen redrawn
+    REDRAW_EVENTS = (
+        pygame.VIDEORESIZE,
+        pygame.VIDEOEXPOSE,
+        pygame.WINDOWEXPOSED,
+        pygame.WINDOWSIZECHANGED,
+        pygame.WINDOWRESTORED,
+    )
+
+    # Posted by the loader whenever an asset loaded or failed
+    LOAD_EVENT = pygame.event.custom_type()
 
     # State
     running = True
-    fade_step = 0
-    is_fading = False
     is_fullscreen = True
     phase_started_at: float = 0
 
-    def __init__(self, config: ConfigSchema):
-        self.cm = ConfigManager(config)
+    def __init__(
+        self,
+        config: "ConfigSchema",
+        stream_soundtracks: bool = False,
+        use_disk_cache: bool = True,
+        workers: int = 1,
+        load_report: bool = False,
+        fade_fps: int = FADE_FPS,
+        idle_fps: int = IDLE_FPS,
+        profiler: Optional[Profiler] = None,
+        memory_budget: Optional[int] = None,
+        watch: Optional[str] = None,
+        control: Optional["ControlServer"] = None,
+        bundle: Optional[Bundle] = None,
+        timeline: Optional[StartupTimeline] = None,
+    ):
+        """
+        Args:
+            watch: Path of the config, reloaded while playing when it or its
+                assets change.
+            control: Started with the game, its commands arrive as events.
+            bundle: Mounted bundle the config came from, assets load from it.
+            timeline: Startup so far, finished once the first frame is drawn.
+        """
+        self.fade_fps = fade_fps
+        self.idle_fps = idle_fps
+        self.memory_budget = memory_budget
+        self._watch = watch
+        self._control = control
+        # Whether remote phase changes fade, toggled remotely
+        self._control_fade = True
+        # Phases removed by a reload, unloaded once they've faded out
+        self._retired: Dict[int, Phase] = {}
+        self._profiler = profiler or Profiler()
+        self._timeline = timeline or StartupTimeline(time.perf_counter())
+        self.cm = ConfigManager(
+            config,
+            asset_index=bundle,
+            stream_soundtracks=stream_soundtracks,
+            background_size=self.LOGICAL_SIZE,
+            use_disk_cache=use_disk_cache,
+            workers=workers,
+            load_report=load_report,
+            memory_budget=memory_budget,
+        )
         pygame.font.init()
         pygame.mixer.pre_init(44100, -16, 1, 512)
         pygame.mixer.init()
 
-        self.__screen = pygame.display.set_mode(
-            self.INITIAL_WINDOW_SIZE, pygame.RESIZABLE
+        self.__screen = self.open_window()
+
+        # Output area, backgrounds and font at the window's resolution
+        self._window_size = (0, 0)
+        self._output = pygame.Rect(0, 0, 0, 0)
+        self._bars: List[pygame.Rect] = []
+        self._scale = 1.0
+        # Backgrounds at output size by phase, with the size they're scaled to.
+        # Filled on loading threads, and rescaled on one when the window changes
+        self._backgrounds: Dict[int, Tuple[Tuple[int, int], pygame.Surface]] = {}
+        self._rescaler = ThreadPoolExecutor(1)
+        self._text = TextCache()
+        self._crossfade = Crossfade(
+            self.TRANSITION_DURATION_SECONDS, self.MAX_FADE_LAYERS
         )
+        self._font_path = self.cm.get_font()
+        self._update_output()
+
+        # Redraw state, frames are only drawn when something on screen changed
+        self._dirty = True
+        self._shown_time = ""
+        self._next_frame_at = 0.0
+        # Whether a frame is due at _next_frame_at, rather than it only being
+        # the soonest the next one may be drawn
+        self._frame_due = False
+        # Shown in the HUD when a phase, sfx or playlist track failed to load
+        self._load_error: Optional[str] = None
+
+    @classmethod
+    def open_window(cls, status: Optional[str] = None) -> pygame.Surface:
+        """
+        The game window, opened by the first call. Pass a status to show it
+        in pygame's default font, for before the config and its font are known.
+        """
+        screen = pygame.display.get_surface()
+        if screen is None:
+            screen = pygame.display.set_mode(cls.INITIAL_WINDOW_SIZE, pygame.RESIZABLE)
+            pygame.display.set_caption("Phusic")
+
+        if status is not None:
+            pygame.font.init()
+            text = pygame.font.Font(None, cls.FONT_SIZE).render(
+                status, True, (255, 255, 255)
+            )
+            screen.fill((0, 0, 0))
+            screen.blit(text, text.get_rect(center=screen.get_rect().center))
+            pygame.display.flip()
+            pygame.event.pump()
 
-        self.font = pygame.font.Font(self.cm.get_font(), self.FONT_SIZE)
-        pygame.display.set_caption("Phusic")
+        return screen
 
     def run(self) -> None:
-        clock = pygame.time.Clock()
-        self.cm.load_assets()
+        self._start_loading()
+        self._timeline.mark("loading started")
+
+        if self._show_loading():
+            self._timeline.mark("start phase loaded")
+            self._initial_phase()
+
+            while self.running:
+                self._step()
+
+        # Playlist feeders decode on the pool, stopped before it closes
+        StreamingSound.stop_all()
+        Playlist.stop_all()
+        self.cm.cancel()
+        self._profiler.report(self.cm.get_load_timings())
+        if self.memory_budget is not None:
+            self.residency.report()
+        if self._control is not None:
+            self._control.stop()
+            self._control.report()
+        pygame.quit()
+        sys.exit()
 
-        fake_progress = 0
-        while self.cm.status()["loading"]:
-            load = self.cm.status()["latest_load"]
-            fake_progress += 0.02
-            self._draw_loading_screen(f"Loading: {load}", fake_progress % 1)
+    def _show_loading(self) -> bool:
+        """
+        Show the loading progress until the start phase is loaded, the rest
+        loads while playing. Redrawn whenever the loader posts a LOAD_EVENT.
+        False if the game was quit first.
+        """
+        start_phase = self.curr_phase.value
+
+        while not self.cm.loader.is_loaded(start_phase):
+            self._draw_loading_screen(self.cm.loader.progress())
             self._render()
-            time.sleep(0.01)
 
-        res = self.cm.get_assets()
-        self.phases = res["phases"]
-        self.sfx = res["sfx"]
+            for event in [pygame.event.wait()] + pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return False
 
-        start_phase = next(
-            phase for phase in self.phases if phase.unique_id == config.start_phase
-        )
-        if not start_phase:
-            raise ValueError("Start phase not found")
+                ctrl = pygame.key.get_mods() & pygame.KMOD_CTRL
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_c and ctrl:
+                    return False
 
-        self.linked_list = util.create_linked_list(start_phase, self.phases)
-        self.curr_phase = self.linked_list.head
-        self.next_phase = Node(None)
+        return True
 
-        self._initial_phase()
+    def _start_loading(self) -> None:
+        """Load in the background, starting from the start phase."""
+        self.cm.loader.prepare = self._prepare
+        self.cm.loader.on_progress = lambda: pygame.event.post(
+            pygame.event.Event(self.LOAD_EVENT)
+        )
+        self.cm.load_assets()
+
+        self.graph = self.cm.get_phase_graph()
+        self.sfx = self.cm.get_sfx()
 
-        # Main loop
-        while self.running:
-            self._handle_events()
+        # Window-sized copies count against the budget, and go with their phase
+        self.residency = self.cm.get_residency()
+        self.residency.extra_bytes = lambda: sum(
+            b.get_width() * b.get_height() * b.get_bytesize()
+            for _, b in list(self._backgrounds.values())
+        )
+        self.residency.on_unload = lambda p: self._backgrounds.pop(id(p), None)
+
+        self.curr_phase = self.graph.head
+        self._prefetch_around(self.curr_phase)
+        self._bind_keys()
+
+        if self._watch is not None:
+            roots = self.cm.get_asset_roots()
+            self._watcher = ConfigWatcher(self._watch, roots).start()
+
+        if self._control is not None:
+            self._control.start()
+            self._publish()
+
+    def _step(self) -> None:
+        """One pass of the main loop, waits for events until the next deadline."""
+        self._handle_events(self._next_deadline())
+
+        now = time.monotonic()
+        if self._dirty and now >= self._next_frame_at:
+            fps = self.fade_fps if self.is_fading else self.idle_fps
+            # A frame drawn after idling isn't late, nothing was waiting on it
+            late = now - self._next_frame_at if self._frame_due else 0.0
+            self._next_frame_at = now + 1.0 / fps
+            self._dirty = False
             self._draw_phase()
             self._render()
-            clock.tick(self.FPS)
+            self._frame_due = self.is_fading
+            self._profiler.frame(time.monotonic() - now, late, 1.0 / fps)
 
-        pygame.quit()
-        sys.exit()
+            if not self._timeline.finished:
+                self._timeline.mark("first frame")
+                self._timeline.finish()
+
+        self._prefetch_around(self.curr_phase)
+
+    def _next_deadline(self) -> float:
+        """Seconds until the next frame, clock minute or automatic phase change."""
+        now = time.monotonic()
+
+        if self._dirty or self.is_fading:
+            return max(0.0, self._next_frame_at - now)
+
+        deadlines = [60 - time.time() % 60]
+
+        duration = self.curr_phase.value.duration
+        if duration is not None and self.curr_phase.next is not None:
+            deadlines.append(self.phase_started_at + duration - now)
+
+        return max(0.0, min(deadlines))
 
-    def _handle_events(self) -> None:
-        for event in pygame.event.get():
+    def _handle_events(self, timeout: float = 0) -> None:
+        """Handle pending events, waiting up to timeout seconds for the first."""
+        events = pygame.event.get()
+        if not events and timeout > 0:
+            # Round up, waking early would only spin until the deadline
+            event = pygame.event.wait(math.ceil(timeout * 1000))
+            events = [event] + pygame.event.get()
+
+        with self._profiler.stage("events"):
+            self._dispatch_events(events)
+
+    def _dispatch_events(self, events: List[pygame.event.Event]) -> None:
+        for event in events:
             if event.type == pygame.QUIT:
                 self.running = False
 
             elif event.type == pygame.KEYDOWN:
                 self._handle_keydown(event)
 
+            elif event.type in self.REDRAW_EVENTS:
+                self._dirty = True
+
+            elif event.type == RELOAD_EVENT:
+                self._reload(event.changed)
+
+            elif event.type == Playlist.ERROR_EVENT:
+                self._load_error = event.message
+                self._dirty = True
+
+            elif self._control is not None and event.type == self._control.EVENT:
+                self._handle_control(event)
+
+        if self.is_fading or util.get_local_time() != self._shown_time:
+            self._dirty = True
+
         # Automatic phase change
         if self.curr_phase.value.duration is None:
             return
 
-        time_in_phase = time.time() - self.phase_started_at
+        time_in_phase = time.monotonic() - self.phase_started_at
         if time_in_phase > self.curr_phase.value.duration:
-            self._change_phase(self.curr_phase.next)
+            node = self.curr_phase
+            self._change_phase(node.next)
 
-    def _handle_keydown(self, event: Event) -> None:
-        if event.key == getattr(pygame, KEYBIND_FULLSCREEN):
-            self._toggle_fullscreen()
+            # The next phase failed to load, wait another duration to retry
+            if self.curr_phase is node:
+                self.phase_started_at = time.monotonic()
 
-        if event.key == pygame.K_LEFT:
-            self._change_phase(self.curr_phase.prev)
+    def _bind_keys(self) -> None:
+        """Resolve every key to its actions once, a keypress is a dict lookup."""
+        self._actions: Dict[int, List[Callable[[], None]]] = {}
+        self._ctrl_actions: Dict[int, Callable[[], None]] = {
+            pygame.K_LEFT: lambda: self._set_phase(self.curr_phase.prev),
+            pygame.K_RIGHT: lambda: self._set_phase(self.curr_phase.next),
+            pygame.K_c: self._quit,
+        }
 
-        if event.key == pygame.K_RIGHT or event.key == pygame.K_SPACE:
-            self._change_phase(self.curr_phase.next)
+        def bind(key: int, action: Callable[[], None]) -> None:
+            self._actions.setdefault(key, []).append(action)
 
-        if pygame.key.get_mods() & pygame.KMOD_CTRL:
-            if event.key == pygame.K_LEFT:
-                self._set_phase(self.curr_phase.prev)
-            elif event.key == pygame.K_RIGHT:
-                self._set_phase(self.curr_phase.next)
-            elif event.key == pygame.K_c:
-                exit(0)
-
-        for phase in self.phases:
-            if phase.key is not None and event.key == getattr(pygame, phase.key):
-                ending_node = Node(phase)
-                self._change_phase(ending_node)
+        bind(getattr(pygame, KEYBIND_FULLSCREEN), self._toggle_fullscreen)
+        bind(pygame.K_LEFT, lambda: self._change_phase(self.curr_phase.prev))
+        bind(pygame.K_RIGHT, lambda: self._change_phase(self.curr_phase.next))
+        bind(pygame.K_SPACE, lambda: self._change_phase(self.curr_phase.next))
+
+        for key, node in self.graph.keys.items():
+            bind(key, partial(self._change_phase, node))
 
         for sfx in self.sfx:
-            if event.key == sfx.key:
-                sfx.sound.play()
+            bind(sfx.key, partial(self._play_sfx, sfx))
+
+        # Remote commands, by action, taking the command's argument
+        sfx_by_name = {sfx.name: sfx for sfx in self.sfx}
+        self._control_actions: Dict[str, Callable[[Optional[str]], None]] = {
+            "next": lambda _: self._control_phase(self.curr_phase.next),
+            "prev": lambda _: self._control_phase(self.curr_phase.prev),
+            "phase": lambda arg: self._control_phase(self.graph.nodes.get(arg)),
+            "sfx": lambda arg: arg in sfx_by_name and self._play_sfx(sfx_by_name[arg]),
+            "fade": lambda _: self._toggle_control_fade(),
+        }
+
+    def _handle_keydown(self, event: pygame.event.Event) -> None:
+        if pygame.key.get_mods() & pygame.KMOD_CTRL:
+            action = self._ctrl_actions.get(event.key)
+            if action is not None:
+                action()
+                return
+
+        for action in self._actions.get(event.key, []):
+            action()
+
+    def _handle_control(self, event: pygame.event.Event) -> None:
+        action = self._control_actions.get(event.action)
+        if action is not None:
+            action(event.arg)
+            self._control.record(event.sent_at)
+
+    def _control_phase(self, phase_node: Optional[PhaseNode]) -> None:
+        if self._control_fade:
+            self._change_phase(phase_node)
+        else:
+            self._set_phase(phase_node)
+
+    def _toggle_control_fade(self) -> None:
+        self._control_fade = not self._control_fade
+        self._publish()
+
+    def _publish(self) -> None:
+        """Share the graph and current phase with remote controls."""
+        if self._control is None:
+            return
+
+        phases = [
+            {
+                "unique_id": node.unique_id,
+                "name": node.value.name,
+                "next": node.next and node.next.unique_id,
+                "prev": node.prev and node.prev.unique_id,
+            }
+            for node in self.graph.nodes.values()
+        ]
+        self._control.publish(
+            {
+                "current": self.curr_phase.unique_id,
+                "fade": self._control_fade,
+                "phases": phases,
+                "sfx": [sfx.name for sfx in self.sfx],
+            }
+        )
+
+    def _quit(self) -> None:
+        self.running = False
+
+    def _play_sfx(self, sfx: Sfx) -> None:
+        if self._wait_loaded(sfx):
+            sfx.sound.play()
+
+    def _wait_loaded(self, item: Loadable) -> bool:
+        """
+        Wait for a phase or sfx to load. If it couldn't be, the error is shown
+        in the HUD and False returned, so the caller leaves things as they are.
+        The error goes once something loads again.
+        """
+        try:
+            self.residency.wait(item)
+        except Exception as e:
+            self._load_error = f"Couldn't load {item.name}: {e}"
+            self._redraw_now()
+            return False
+
+        if self._load_error is not None:
+            self._load_error = None
+            self._dirty = True
+
+        return True
+
+    def _reload_font(self) -> None:
+        """Switch to the config's font, keeping the old one if it can't be loaded."""
+        path = self.cm.get_font()
+        text = TextCache()
+
+        try:
+            font = text.font(path, self._scaled(self.FONT_SIZE))
+            # A broken font file only fails once something is rendered
+            font.render("0", True, (255, 255, 255))
+        except Exception as e:
+            print(util.generate_title_str(f"❗ Font not reloaded: {e}", 1))
+            return
+
+        self.font = font
+        self._font_path = path
+        self._text = text
 
     def _toggle_fullscreen(self) -> None:
         self.is_fullscreen = not self.is_fullscreen
+        self._redraw_now()
 
         if self.is_fullscreen:
             self.__screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
@@ -141,176 +467,336 @@ class Game:
                 self.INITIAL_WINDOW_SIZE, pygame.RESIZABLE
             )
 
+    @property
+    def is_fading(self) -> bool:
+        return self._crossfade.is_fading
+
     def _initial_phase(self) -> None:
         phase = self.curr_phase.value
-        phase.sound.set_volume(1.0)
-        phase.sound.play(-1)
-        phase.background = pygame.transform.scale(phase.background, self.LOGICAL_SIZE)
-        self.phase_started_at = time.time()
-
-    def _change_phase(self, phase_node: Optional[Node]) -> None:
-        if self.is_fading:
+        phase.play(1.0)
+        self._timeline.mark("first audio")
+        self.phase_started_at = time.monotonic()
+        self._crossfade.reset(phase, self.phase_started_at)
+
+    def _change_phase(self, phase_node: Optional[PhaseNode]) -> None:
+        """Fade to a phase, from the current blend if a fade is running."""
+        if not phase_node or phase_node is self.curr_phase:
             return
 
-        if not phase_node:
+        phase = phase_node.value
+        if not self._wait_loaded(phase):
             return
 
-        self.is_fading = True
-        self.fade_step = 0
-        self.next_phase = phase_node
+        # Prepared while loading, only scaled here if the window just changed
+        self._scaled_background(phase)
 
-        phase = phase_node.value
-        phase.sound.set_volume(0.0)
-        phase.sound.play(-1)
-        phase.background = pygame.transform.scale(phase.background, self.LOGICAL_SIZE)
-        self.phase_started_at = time.time()
+        # A phase still fading out keeps playing from where it is
+        playing = self._crossfade.contains(phase)
+        self.phase_started_at = time.monotonic()
+        self._drop(self._crossfade.start(phase, self.phase_started_at))
+
+        if not playing:
+            phase.play(0.0)
 
-    def _set_phase(self, phase_node: Optional[Node]) -> None:
+        self._enter(phase_node)
+
+    def _set_phase(self, phase_node: Optional[PhaseNode]) -> None:
         """Update the current phase without fading"""
         if not phase_node:
             return
 
-        if self.next_phase.value:
-            self.next_phase.value.sound.stop()
+        phase = phase_node.value
+        if not self._wait_loaded(phase):
+            return
+
+        self.phase_started_at = time.monotonic()
+        self._drop(self._crossfade.reset(phase, self.phase_started_at))
 
-        self.curr_phase.value.sound.stop()
-        self.is_fading = False
-        self.fade_step = 0
+        phase.play(1.0)
 
-        phase = phase_node.value
-        phase.sound.set_volume(1.0)
-        phase.sound.play(-1)
-        phase.background = pygame.transform.scale(phase.background, self.LOGICAL_SIZE)
+        self._enter(phase_node)
 
+    def _enter(self, phase_node: PhaseNode) -> None:
         self.curr_phase = phase_node
-        self.phase_started_at = time.time()
+        self._prefetch_around(phase_node)
+        self._publish()
+        self._redraw_now()
 
-    def _draw_phase(self) -> None:
-        curr_phase = self.curr_phase.value
-        next_phase = self.next_phase.value
+    def _drop(self, phases: Iterable[Phase]) -> None:
+        """Stop phases that left the screen, unloading those a reload removed."""
+        for phase in phases:
+            phase.stop()
+
+            if self._retired.pop(id(phase), None) is not None:
+                phase.unload()
+                self._backgrounds.pop(id(phase), None)
 
-        text_margin = 32
-        clock_margin = 64
+    def _reload(self, changed: Set[str]) -> None:
+        """
+        Switch to the changed config and assets while playing. Only what
+        changed is loaded, and the current phase plays on if it was kept.
+        """
+        start = time.perf_counter()
+
+        from config_cop import patrol_config
+
+        refresh_asset_indexes()
+        try:
+            config = patrol_config(self._watch)
+        except Exception as e:
+            # Whatever validation raises, the game plays on with the old one
+            print(util.generate_title_str(f"❗ Not reloaded: {e}", 1))
+            return
 
-        if self.is_fading:
-            # Handle fade background
-            alpha = int(self.fade_step * (255 / self.TOTAL_FADE_STEPS))
-            next_phase.background.set_alpha(alpha)
-            self.logical_surface.blit(curr_phase.background, (0, 0))
-            self.logical_surface.blit(next_phase.background, (0, 0))
+        reload = self.cm.reload(config, changed)
+        self.graph = self.cm.get_phase_graph()
+        self.sfx = self.cm.get_sfx()
+        self._watcher.roots = self.cm.get_asset_roots()
 
-            # Handle fade sound
-            new_volume = alpha / 255.0
-            next_phase.sound.set_volume(new_volume)
-            curr_phase.sound.set_volume(1.0 - new_volume)
+        on_screen = {id(layer.phase) for layer in self._crossfade.layers}
+        for item in reload.removed:
+            if id(item) in on_screen:
+                self._retired[id(item)] = item
+            else:
+                item.unload()
+                self._backgrounds.pop(id(item), None)
 
-            self.fade_step += self.FADE_STEPS
+        if reload.font_changed:
+            self._reload_font()
 
-            if self.fade_step > self.TOTAL_FADE_STEPS:
-                self.is_fading = False
-                curr_phase.sound.stop()
-                self.curr_phase = self.next_phase
+        self._bind_keys()
+
+        phase = self.curr_phase.value
+        node = self.graph.nodes.get(self.curr_phase.unique_id)
+        if node is not None and phase in node.variants:
+            node.variant = node.variants.index(phase)
+            self.curr_phase = node
+            self._prefetch_around(node)
+            self._publish()
+            self._redraw_now()
         else:
-            self.logical_surface.blit(curr_phase.background, (0, 0))
+            # Changed or removed, fade to its new version or the start
+            self._change_phase(node or self.graph.head)
+
+        seconds = time.perf_counter() - start
+        print(
+            util.generate_title_str(
+                f"Reloaded {self._watch} in {seconds * 1000:.0f} ms: "
+                f"{reload.kept} kept, {len(reload.added)} new, "
+                f"{len(reload.removed)} removed",
+                1,
+            )
+        )
+
+    def _redraw_now(self) -> None:
+        """Draw the next frame right away, regardless of the idle frame rate."""
+        self._dirty = True
+        self._next_frame_at = time.monotonic()
+        self._frame_due = True
+
+    def _prefetch_around(self, phase_node: PhaseNode) -> None:
+        """
+        Load the phases nearest to this one first, and unload the farthest
+        when over the memory budget. Phases still on screen stay loaded.
+        """
+        on_screen = [layer.phase for layer in self._crossfade.layers]
+        self.residency.update(phase_node, on_screen)
+
+    def _update_output(self) -> None:
+        """Fit LOGICAL_SIZE into the window, redone only when the window changes."""
+        window_size = self.__screen.get_size()
+        if window_size == self._window_size:
+            return
 
-            # Draw phase name
-            phase_position = (
-                text_margin,
-                self.LOGICAL_SIZE[1] - self.FONT_SIZE - text_margin,
+        logical_aspect_ratio = self.LOGICAL_SIZE[0] / self.LOGICAL_SIZE[1]
+        window_aspect_ratio = window_size[0] / window_size[1]
+
+        if logical_aspect_ratio > window_aspect_ratio:
+            new_width = window_size[0]
+            new_height = int(new_width / logical_aspect_ratio)
+        else:
+            new_height = window_size[1]
+            new_width = int(new_height * logical_aspect_ratio)
+
+        x_position = (window_size[0] - new_width) // 2
+        y_position = (window_size[1] - new_height) // 2
+
+        self._window_size = window_size
+        self._output = pygame.Rect(x_position, y_position, new_width, new_height)
+        self._scale = new_width / self.LOGICAL_SIZE[0]
+
+        # Letterbox bars, at most two of them are non-empty
+        width, height = window_size
+        self._bars = [
+            rect
+            for rect in [
+                pygame.Rect(0, 0, width, self._output.top),
+                pygame.Rect(0, self._output.bottom, width, height),
+                pygame.Rect(0, 0, self._output.left, height),
+                pygame.Rect(self._output.right, 0, width, height),
+            ]
+            if rect.width > 0 and rect.height > 0
+        ]
+
+        if self._backgrounds:
+            self._rescaler.submit(self._rescale_loaded)
+        self.font = self._text.font(self._font_path, self._scaled(self.FONT_SIZE))
+
+    def _scaled(self, length: float) -> int:
+        """A length in logical pixels, in window pixels."""
+        return max(1, round(length * self._scale))
+
+    def _scaled_background(self, phase: Phase) -> pygame.Surface:
+        """The phase background at output size, scaled if it isn't yet."""
+        size = self._output.size
+        scaled = self._backgrounds.get(id(phase))
+
+        if scaled is None or scaled[0] != size:
+            background = pygame.transform.smoothscale(phase.background, size)
+            scaled = self._backgrounds[id(phase)] = (size, background.convert())
+
+        return scaled[1]
+
+    def _prepare(self, item) -> None:
+        """
+        Scale a phase's background to the output as part of loading it, on
+        the loading thread. Phases are entered once loaded, so entering one
+        never scales on the main thread. smoothscale releases the GIL.
+        """
+        if isinstance(item, Phase):
+            self._scaled_background(item)
+
+    def _rescale_loaded(self) -> None:
+        """Bring every prepared background to a new output size."""
+        for node in list(self.graph.nodes.values()):
+            for phase in node.variants:
+                if id(phase) in self._backgrounds and phase.background is not None:
+                    self._scaled_background(phase)
+
+    def _draw_phase(self) -> None:
+        self._update_output()
+        now = time.monotonic()
+
+        # Layers covered by a finished fade stop playing right away
+        self._drop(self._crossfade.update(now))
+
+        stage = "draw.fade" if self.is_fading else "draw.background"
+        with self._profiler.stage(stage):
+            self._crossfade.draw(
+                self.__screen, self._output, now, self._scaled_background
             )
 
-            surface = self._draw_text_with_outline(curr_phase.name, phase_position)
+        # Volumes follow how much of each layer shows
+        for layer, weight in zip(self._crossfade.layers, self._crossfade.weights(now)):
+            layer.phase.set_volume(weight)
+
+        if not self.is_fading:
+            with self._profiler.stage("draw.text"):
+                self._draw_hud()
 
-            # Draw time
+    def _draw_hud(self) -> None:
+        """The phase name and the time, along the bottom."""
+        text_margin = self._scaled(32)
+        clock_margin = self._scaled(64)
+        curr_phase = self.curr_phase.value
+
+        # Draw phase name
+        phase_position = (
+            self._output.left + text_margin,
+            self._output.bottom - self._scaled(self.FONT_SIZE) - text_margin,
+        )
+
+        surface = self._draw_text_with_outline(curr_phase.name, phase_position)
+
+        # Draw the last load error, above the phase name
+        if self._load_error is not None:
             self._draw_text_with_outline(
-                util.get_local_time(),
-                (surface.get_width() + clock_margin, phase_position[1]),
-                opacity=0.6,
+                self._load_error,
+                (
+                    phase_position[0],
+                    phase_position[1] - self._scaled(self.FONT_SIZE) - text_margin,
+                ),
             )
 
-        pygame.display.flip()
+        # Draw time
+        self._shown_time = util.get_local_time()
+        self._draw_text_with_outline(
+            self._shown_time,
+            (
+                self._output.left + surface.get_width() + clock_margin,
+                phase_position[1],
+            ),
+            opacity=0.6,
+        )
 
     def _draw_text_with_outline(
         self, text, position, outline_width: int = 2, opacity: int = 1
     ) -> pygame.Surface:
         """
-        Draws text on a pygame surface with an outline effect.
+        Draws text on the screen with an outline effect, from the text cache.
 
         Returns:
         - pygame.Surface: The surface with the text (including its outline) drawn on it.
         """
         x, y = position
-
-        for dx, dy in [
-            (ow, oh)
-            for ow in range(-outline_width, outline_width + 1)
-            for oh in range(-outline_width, outline_width + 1)
-            if ow != 0 or oh != 0
-        ]:
-            text_surface = self.font.render(text, True, (0, 0, 0))
-            text_surface = text_surface.convert_alpha()
-            text_surface.set_alpha(opacity * 255)
-            self.logical_surface.blit(text_surface, (x + dx, y + dy))
-
-        text_surface = self.font.render(text, True, (255, 255, 255))
-        text_surface = text_surface.convert_alpha()
-        text_surface.set_alpha(opacity * 255)
-        self.logical_surface.blit(text_surface, position)
+        outline_width = self._scaled(outline_width)
+
+        text_surface = self._text.outlined(
+            text,
+            self._font_path,
+            self._scaled(self.FONT_SIZE),
+            outline_width,
+            opacity,
+        )
+        self.__screen.blit(text_surface, (x - outline_width, y - outline_width))
 
         return text_surface
 
-    def _draw_loading_screen(self, text: str, progress: float) -> None:
-        self.logical_surface.fill((0, 0, 0))
-
-        # Draw text
-        text_surface = self.font.render(text, True, (255, 255, 255))
-        center_width = self.LOGICAL_SIZE[0] // 2
-        center_height = self.LOGICAL_SIZE[1] // 2
-        text_rect = text_surface.get_rect(center=(center_width, center_height - 50))
-        self.logical_surface.blit(text_surface, text_rect)
-
-        circle_radius = 10
-        movement_width = 200
-        circle_x_start = center_width - movement_width // 2
-        circle_y = center_height + 10 + circle_radius
-
-        progress_modulo = progress % 1.0
-        oscillation = math.sin(progress_modulo * math.pi * 2)
-        circle_x = (
-            circle_x_start
-            + (movement_width // 2)
-            + (oscillation * (movement_width // 2 - circle_radius))
-        )
+    def _draw_loading_screen(self, progress: LoadProgress) -> None:
+        self._update_output()
+        self.__screen.fill((0, 0, 0))
+        center_width, center_height = self._output.center
 
-        pygame.draw.circle(
-            self.logical_surface,
-            (255, 255, 255),
-            (int(circle_x), circle_y),
-            circle_radius,
-        )
+        mb = 1024 * 1024
+        if progress.error is not None:
+            lines = [f"Couldn't load {progress.error}", "Close the window to quit"]
+        else:
+            eta = "" if progress.eta is None else f", {progress.eta:.0f}s left"
+            lines = [
+                f"Loading: {progress.latest}",
+                f"{progress.done}/{progress.total} assets, "
+                f"{progress.bytes_done / mb:.1f}/{progress.bytes_total / mb:.1f} MB"
+                f"{eta}",
+            ]
 
-    def _render(self) -> None:
-        window_size = pygame.display.get_surface().get_size()
-        logical_aspect_ratio = self.LOGICAL_SIZE[0] / self.LOGICAL_SIZE[1]
-        window_aspect_ratio = window_size[0] / window_size[1]
+        # Draw text
+        for i, line in enumerate(lines):
+            text_surface = self.font.render(line, True, (255, 255, 255))
+            text_rect = text_surface.get_rect(
+                center=(
+                    center_width,
+                    center_height - self._scaled(100) + self._scaled(60) * i,
+                )
+            )
+            self.__screen.blit(text_surface, text_rect)
 
-        if logical_aspect_ratio > window_aspect_ratio:
-            new_width = window_size[0]
-            new_height = int(new_width / logical_aspect_ratio)
-        else:
-            new_height = window_size[1]
-            new_width = int(new_height * logical_aspect_ratio)
+        # Draw progress bar, by bytes
+        bar = pygame.Rect(0, 0, self._scaled(600), self._scaled(20))
+        bar.center = (center_width, center_height + self._scaled(40))
+        pygame.draw.rect(self.__screen, (255, 255, 255), bar, max(1, self._scaled(2)))
 
-        scaled_surface = pygame.transform.smoothscale(
-            self.logical_surface, (new_width, new_height)
-        )
+        fraction = progress.bytes_done / max(progress.bytes_total, 1)
+        filled = bar.inflate(-self._scaled(8), -self._scaled(8))
+        filled.width = round(filled.width * fraction)
+        if filled.width > 0:
+            pygame.draw.rect(self.__screen, (255, 255, 255), filled)
 
-        x_position = (window_size[0] - new_width) // 2
-        y_position = (window_size[1] - new_height) // 2
+    def _render(self) -> None:
+        with self._profiler.stage("render.flip"):
+            for bar in self._bars:
+                self.__screen.fill((0, 0, 0), bar)
 
-        self.__screen.fill((0, 0, 0))
-        self.__screen.blit(scaled_surface, (x_position, y_position))
-        pygame.display.flip()
+            pygame.display.flip()
 
 
 if __name__ == "__main__":
@@ -323,14 +809,136 @@ if __name__ == "__main__":
         type=str,
         help="Path to configuration file",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Decode soundtracks in chunks while playing instead of up front",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't read or write decoded assets in the on-disk cache",
+    )
+    parser.add_argument(
+        "--workers",
+        default=available_cores(),
+        type=int,
+        help="Processes decoding assets while loading, 1 decodes in-process",
+    )
+    parser.add_argument(
+        "--load-report",
+        action="store_true",
+        help="Print how long each asset took to load",
+    )
+    parser.add_argument(
+        "--fade-fps",
+        default=Game.FADE_FPS,
+        type=int,
+        help="Frame rate ceiling while fading between phases",
+    )
+    parser.add_argument(
+        "--idle-fps",
+        default=Game.IDLE_FPS,
+        type=int,
+        help="Frame rate ceiling outside of fades",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=PATH_PROFILE,
+        default=None,
+        metavar="PATH",
+        help=f"Time every frame's stages, report them on exit and write them "
+        f"as JSON to PATH ({PATH_PROFILE} by default)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Reload the config and its assets while playing when they change",
+    )
+    parser.add_argument(
+        "--control",
+        default=None,
+        type=int,
+        metavar="PORT",
+        help="Serve a remote control over HTTP and WebSocket on PORT",
+    )
+    parser.add_argument(
+        "--control-host",
+        default="127.0.0.1",
+        help="Address of the remote control, 0.0.0.0 to reach it over the LAN",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        default=None,
+        type=int,
+        metavar="MB",
+        help="Megabytes of decoded assets to keep, phases far from the current "
+        "one are unloaded past it and reloaded when they come near",
+    )
+    parser.add_argument(
+        "--bundle",
+        default=None,
+        type=str,
+        metavar="PATH",
+        help="Play a bundle from `python src/bundle.py`, instead of --config",
+    )
+    parser.add_argument(
+        "--startup-report",
+        action="store_true",
+        help="Print how long each step of startup took, once the first frame "
+        "is drawn",
+    )
     args = parser.parse_args()
 
-    # Validate configs
-    patrol()
-    config = ConfigManager.parse_schema(args.config)
+    timeline = StartupTimeline(STARTED_AT, report=args.startup_report)
+    timeline.mark("imports")
 
-    # Write controls
-    util.generate_controls_file(config)
+    # Show something before validating, parsing and loading
+    Game.open_window("Starting")
+    timeline.mark("window")
 
-    game = Game(config)
+    from config_cop import patrol_config
+    from dataobjects.config_schema import ConfigSchema
+
+    bundle = None
+    if args.bundle is not None:
+        if args.watch:
+            parser.error("--watch needs a config, bundles can't be reloaded")
+
+        # Validated when it was packed
+        bundle = mount(args.bundle)
+        config = ConfigSchema(**bundle.config)
+        timeline.mark("parse")
+    else:
+        # Validate the selected config, `python src/config_cop.py` validates all
+        config = patrol_config(args.config)
+        timeline.mark("parse and validate")
+
+    # Write controls, if they changed
+    util.generate_controls_file(config)
+    timeline.mark("controls")
+
+    control = None
+    if args.control is not None:
+        from control_server import ControlServer
+
+        control = ControlServer(args.control, args.control_host)
+
+    game = Game(
+        config,
+        stream_soundtracks=args.stream,
+        use_disk_cache=not args.no_cache,
+        workers=args.workers,
+        load_report=args.load_report,
+        fade_fps=args.fade_fps,
+        idle_fps=args.idle_fps,
+        profiler=StageProfiler(args.profile) if args.profile else None,
+        memory_budget=args.memory_budget and args.memory_budget * 1024 * 1024,
+        watch=args.config if args.watch else None,
+        control=control,
+        bundle=bundle,
+        timeline=timeline,
+    )
+    timeline.mark("game")
     game.run()
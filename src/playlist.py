@@ -0,0 +1,259 @@
+import atexit
+import os
+import random
+import threading
+import weakref
+from collections import deque
+from typing import Deque, Iterator, List, Optional, Tuple, Union
+
+import pygame
+
+from decoders import Decoder
+from sound_cache import SoundCache
+from streaming_sound import StreamingSound
+
+"""Soundtracks played one after another, without a gap between them."""
+
+Track = Union[pygame.mixer.Sound, StreamingSound]
+
+
+class Playlist:
+    """
+    Stand-in for pygame.mixer.Sound that plays a phase's soundtracks in
+    turn, in the listed order or shuffled on every pass.
+
+    Only the playing track and the next one are held. A feeder thread loads
+    the next one as soon as the playing one starts, and queues it on the
+    channel so it starts the moment the playing one ends. Streamed tracks
+    are queued a chunk at a time, as StreamingSound does.
+
+    Decoded tracks come from sounds when given, so phases sharing their
+    soundtracks, like the variants of a phase, hold each track once. They
+    aren't kept in the cache once played. Stopping keeps the playing track,
+    play() starts over from it.
+
+    A track that fails to load is skipped, and an ERROR_EVENT with a message
+    is posted for the game to show.
+    """
+
+    ROTATE = "rotate"
+    SHUFFLE = "shuffle"
+    POLL_SECONDS = 0.05
+    ERROR_EVENT = pygame.event.custom_type()
+
+    _playing: "weakref.WeakSet[Playlist]" = weakref.WeakSet()
+
+    def __init__(
+        self,
+        paths: List[str],
+        mode: str = ROTATE,
+        stream: bool = False,
+        decoder: Optional[Decoder] = None,
+        sounds: Optional[SoundCache] = None,
+    ) -> None:
+        self.paths = paths
+        self.mode = mode
+        self._stream = stream
+        self._decoder = decoder or Decoder()
+        self._sounds = sounds
+        self._order = self._upcoming()
+        self._volume = 1.0
+        self._channel: Optional[pygame.mixer.Channel] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._stopped.set()
+        self._thread: Optional[threading.Thread] = None
+
+        # The track play() starts with, loaded by load()
+        self._first: Optional[Track] = None
+        # While playing: the segment playing and the one queued after it,
+        # with the track each is from
+        self._held: Deque[Tuple[Track, pygame.mixer.Sound]] = deque()
+
+    @property
+    def nbytes(self) -> int:
+        """Decoded bytes of the tracks held, streamed tracks count as 0."""
+        with self._lock:
+            tracks = {id(t): t for t, _ in self._held}
+            if self._first is not None:
+                tracks[id(self._first)] = self._first
+
+        return sum(
+            memoryview(t).nbytes
+            for t in tracks.values()
+            if isinstance(t, pygame.mixer.Sound)
+        )
+
+    def load(self) -> None:
+        """Load the first track, the rest are loaded while playing."""
+        if self._first is None:
+            self._first = self._load(next(self._order))
+
+    def close(self) -> None:
+        """Stop and drop every track, load() loads the next one again."""
+        self.stop()
+        self._release(self._first)
+        self._first = None
+
+    def play(self, loops: int = -1) -> "Playlist":
+        """Start the first track, the playlist repeats forever, like loops=-1."""
+        self.stop()
+        self.load()
+
+        channel = pygame.mixer.find_channel(True)
+        channel.set_volume(self._volume)
+        stopped = threading.Event()
+
+        # The first segment is ready, or a chunk decoded up front when streaming
+        segments = self._segments(self._first)
+        first = next(segments)
+
+        with self._lock:
+            self._first = None
+            self._channel = channel
+            self._stopped = stopped
+            self._held = deque([first])
+            channel.play(first[1])
+
+        self._thread = threading.Thread(
+            target=self._feed, args=(channel, segments, stopped), daemon=True
+        )
+        self._thread.start()
+        self._playing.add(self)
+        return self
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopped.set()
+
+            if self._channel is not None:
+                self._channel.stop()
+                self._channel = None
+
+            # Start over from the track that was playing, drop the queued one
+            if self._held:
+                self._first = self._held[0][0]
+                for track, _ in list(self._held)[1:]:
+                    self._release(track)
+                self._held = deque()
+
+        self._playing.discard(self)
+
+    @classmethod
+    def stop_all(cls) -> None:
+        """Stop every playlist, feeders must not touch the mixer after it quits."""
+        for playlist in list(cls._playing):
+            playlist.stop()
+            if playlist._thread is not None:
+                playlist._thread.join()
+
+    def set_volume(self, value: float) -> None:
+        self._volume = value
+
+        if self._channel is not None:
+            self._channel.set_volume(value)
+
+    def get_volume(self) -> float:
+        return self._volume
+
+    def _upcoming(self) -> Iterator[str]:
+        """Paths in play order, forever."""
+        previous = None
+
+        while True:
+            paths = list(self.paths)
+            if self.mode == self.SHUFFLE:
+                random.shuffle(paths)
+                # Don't play a track twice in a row across passes
+                if len(paths) > 1 and paths[0] == previous:
+                    paths[0], paths[-1] = paths[-1], paths[0]
+
+            yield from paths
+            previous = paths[-1]
+
+    def _load(self, path: str) -> Track:
+        stream = StreamingSound.open(path) if self._stream else None
+        if stream is not None:
+            return stream
+
+        if self._sounds:
+            return self._sounds.acquire(path, retain=False)
+
+        return self._decoder.sound(path)
+
+    def _load_next(self) -> Track:
+        """Load the next track that loads, raises once every one has failed."""
+        for _ in range(len(self.paths)):
+            path = next(self._order)
+            try:
+                return self._load(path)
+            except Exception as e:
+                self._failed(path, e)
+
+        raise RuntimeError("None of the playlist's tracks could be loaded")
+
+    def _failed(self, path: str, error: Exception) -> None:
+        message = f"Couldn't load {os.path.basename(path)}: {error}"
+        print(message)
+        pygame.event.post(pygame.event.Event(self.ERROR_EVENT, message=message))
+
+    def _release(self, track: Optional[Track]) -> None:
+        """Done with a track from _load(), once for every time it was loaded."""
+        if self._sounds and isinstance(track, pygame.mixer.Sound):
+            self._sounds.release(track)
+
+    def _segments(self, first: Track) -> Iterator[Tuple[Track, pygame.mixer.Sound]]:
+        """What to queue, starting with the first track and loading the rest."""
+        track = first
+
+        while True:
+            if isinstance(track, StreamingSound):
+                try:
+                    for chunk in track.decoded_chunks():
+                        yield track, chunk
+                except Exception as e:
+                    # The rest of the track is skipped
+                    self._failed(track.path, e)
+            else:
+                yield track, track
+
+            track = self._load_next()
+
+    def _feed(
+        self,
+        channel: pygame.mixer.Channel,
+        segments: Iterator[Tuple[Track, pygame.mixer.Sound]],
+        stopped: threading.Event,
+    ) -> None:
+        held = self._held
+
+        while not stopped.is_set():
+            with self._lock:
+                if stopped.is_set():
+                    break
+
+                # The queued segment took over, the one before it ended
+                if len(held) == 2 and channel.get_queue() is None:
+                    self._release(held.popleft()[0])
+                queue_next = len(held) == 1
+
+            if queue_next:
+                # Loads the next track, or decodes a chunk, while one plays
+                try:
+                    segment = next(segments)
+                except Exception:
+                    # Every track failed, the playing one is the last
+                    break
+
+                with self._lock:
+                    if stopped.is_set():
+                        self._release(segment[0])
+                        break
+
+                    channel.queue(segment[1])
+                    held.append(segment)
+
+            stopped.wait(self.POLL_SECONDS)
+
+
+atexit.register(Playlist.stop_all)
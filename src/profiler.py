@@ -0,0 +1,164 @@
+import json
+import math
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from decoders import AssetTiming
+from util import generate_title_str
+
+"""Timings of startup and of the main loop's stages."""
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """Nearest rank percentile of sorted samples."""
+    if not samples:
+        return 0.0
+
+    rank = math.ceil(p / 100 * len(samples))
+    return samples[max(rank - 1, 0)]
+
+
+class Profiler:
+    """
+    Does nothing, used when profiling is off. Stages are timed with
+
+        with profiler.stage("draw.text"):
+            ...
+
+    which costs one method call here.
+    """
+
+    _NULL = nullcontext()
+
+    def stage(self, name: str) -> ContextManager[None]:
+        return self._NULL
+
+    def frame(self, seconds: float, late: float, budget: float) -> None:
+        pass
+
+    def report(self, assets: Iterable[AssetTiming] = ()) -> None:
+        pass
+
+
+class StageProfiler(Profiler):
+    """
+    Records how long every stage takes, per frame, and counts the frames that
+    missed their budget. report() prints percentiles per stage and writes
+    them as JSON to path, along with the load time of every asset.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.frames = 0
+        self.dropped = 0
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append(time.perf_counter() - start)
+
+    def frame(self, seconds: float, late: float, budget: float) -> None:
+        """
+        Record a drawn frame. It's dropped when it started more than a frame
+        late or took longer than its budget.
+        """
+        self.frames += 1
+        self.samples["frame"].append(seconds)
+
+        if late > budget or seconds > budget:
+            self.dropped += 1
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        stats = {}
+
+        for name, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            stats[name] = {
+                "count": len(samples),
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p95_ms": percentile(samples, 95) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+                "max_ms": samples[-1] * 1000,
+            }
+
+        return stats
+
+    def report(self, assets: Iterable[AssetTiming] = ()) -> None:
+        from tabulate import tabulate
+
+        stats = self.stats()
+        assets = sorted(assets, key=lambda t: t.seconds, reverse=True)
+
+        rows = [
+            (name, s["count"], *(f"{s[k]:.2f}" for k in list(s)[1:]))
+            for name, s in stats.items()
+        ]
+        title = f"{self.frames} frames, {self.dropped} dropped"
+        print(generate_title_str(title))
+        print(tabulate(rows, ["Stage", "Count", "p50", "p95", "p99", "max"], "github"))
+
+        if self.path is None:
+            return
+
+        with open(self.path, "w") as f:
+            json.dump(
+                {
+                    "frames": self.frames,
+                    "dropped_frames": self.dropped,
+                    "stages": stats,
+                    "assets": [t._asdict() for t in assets],
+                },
+                f,
+                indent=2,
+            )
+
+        print(f"\nProfile written to {self.path}")
+
+
+class StartupTimeline:
+    """
+    When each step of startup finished, from started_at, a perf_counter()
+    time. Marks are cheap and always kept. finish() is called once the first
+    phase frame is drawn, and prints the timeline if report is set.
+    """
+
+    def __init__(self, started_at: float, report: bool = False) -> None:
+        self.started_at = started_at
+        self.print_report = report
+        self.marks: List[Tuple[str, float]] = []
+        self.finished = False
+
+    def mark(self, name: str) -> None:
+        self.marks.append((name, time.perf_counter()))
+
+    def finish(self) -> None:
+        if self.finished:
+            return
+
+        self.finished = True
+        if self.print_report:
+            self.report()
+
+    def report(self) -> None:
+        from tabulate import tabulate
+
+        rows = []
+        previous = self.started_at
+        for name, at in self.marks:
+            rows.append(
+                (
+                    name,
+                    f"{(at - self.started_at) * 1000:.0f}",
+                    f"{(at - previous) * 1000:.0f}",
+                )
+            )
+            previous = at
+
+        print(generate_title_str("Startup"))
+        print(tabulate(rows, ["Step", "At ms", "Took ms"], "github"))
@@ -0,0 +1,185 @@
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+from asset_loader import AssetLoader, Loadable
+from dataobjects.phase import Phase
+from phase_graph import PhaseGraph, PhaseNode
+from sound_cache import SoundCache
+from util import generate_title_str
+
+"""Which phases stay decoded, within a memory budget."""
+
+
+class Residency:
+    """
+    Keeps the decoded phases within max_bytes, nearest first.
+
+    Distance is counted in next/prev steps from the current phase, and
+    key-bound phases count as a step and a half away, so they stay warm but
+    load after the next and previous ones. Phases are queued for loading
+    nearest first as long as they're expected to fit, and the farthest
+    loaded phases are unloaded once the budget is exceeded. Phases on
+    screen, within one step or bound to a key are never unloaded.
+
+    Without a budget nothing is unloaded, only reload stalls are counted.
+    """
+
+    NEIGHBOUR_DISTANCE = 1
+    KEYED_DISTANCE = 1.5
+
+    def __init__(
+        self,
+        graph: PhaseGraph,
+        loader: AssetLoader,
+        sounds: SoundCache,
+        max_bytes: Optional[int] = None,
+    ) -> None:
+        self.loader = loader
+        self.sounds = sounds
+        self.max_bytes = max_bytes
+        # Bytes held elsewhere for resident phases, e.g. window-sized copies
+        self.extra_bytes: Callable[[], int] = lambda: 0
+        self.on_unload: Callable[[Phase], None] = lambda phase: None
+
+        self.evictions = 0
+        self.stalls = 0
+        self.stalled_seconds = 0.0
+        self.peak_bytes = 0
+
+        self._sizes: Dict[int, int] = {}
+        self.set_graph(graph)
+
+    def set_graph(self, graph: PhaseGraph) -> None:
+        """Switch to a rebuilt graph, keeping what's known of phases in both."""
+        self.graph = graph
+        self._phases = [p for node in graph.nodes.values() for p in node.variants]
+        ids = {id(p) for p in self._phases}
+        self._sizes = {i: size for i, size in self._sizes.items() if i in ids}
+        self._node: Optional[PhaseNode] = None
+        self._loaded_count = -1
+
+    def resident_bytes(self) -> int:
+        # Sounds are counted once in the cache, however many phases share them
+        owned = sum(
+            p.background_bytes + p.playlist_bytes
+            for p in self._phases
+            if self._loaded(p)
+        )
+        return self.sounds.nbytes + owned + self.extra_bytes()
+
+    def wait(self, item: Loadable) -> None:
+        """Block until an item is loaded, counting the wait as a stall."""
+        if self.loader.is_loaded(item):
+            return
+
+        start = time.perf_counter()
+        self.loader.wait(item)
+        self.stalls += 1
+        self.stalled_seconds += time.perf_counter() - start
+
+    def update(self, node: PhaseNode, pinned: Iterable[Phase] = ()) -> None:
+        """
+        Queue and unload around the current phase. Cheap to call every frame,
+        the plan is only redone when the phase changed or something loaded.
+        """
+        if node is self._node and self.loader.loaded_count == self._loaded_count:
+            return
+
+        self._node = node
+        self._loaded_count = self.loader.loaded_count
+
+        distances = self._distances(node)
+        order = sorted(self._phases, key=lambda p: distances[id(p)])
+
+        for phase in order:
+            if self._loaded(phase) and id(phase) not in self._sizes:
+                self._sizes[id(phase)] = phase.nbytes
+
+        self._queue(order, distances)
+
+        if self.max_bytes is not None:
+            self._evict(order, distances, {id(p) for p in pinned})
+
+        self.peak_bytes = max(self.peak_bytes, self.resident_bytes())
+
+    def report(self) -> None:
+        mb = 1024 * 1024
+        budget = f"{self.max_bytes / mb:.0f} MB" if self.max_bytes else "no budget"
+
+        print(generate_title_str(f"Memory ({budget})"))
+        print(f"Resident: {self.resident_bytes() / mb:.0f} MB")
+        print(f"Peak resident: {self.peak_bytes / mb:.0f} MB")
+        print(f"Evictions: {self.evictions}")
+        print(f"Reload stalls: {self.stalls}, {self.stalled_seconds:.2f}s in total")
+
+    def _distances(self, node: PhaseNode) -> Dict[int, float]:
+        """Steps from node to every phase, other variants are the farthest."""
+        steps = {node.unique_id: 0}
+        queue = deque([node])
+
+        while queue:
+            current = queue.popleft()
+            for neighbour in [current.next, current.prev]:
+                if neighbour is not None and neighbour.unique_id not in steps:
+                    steps[neighbour.unique_id] = steps[current.unique_id] + 1
+                    queue.append(neighbour)
+
+        for keyed in self.graph.keys.values():
+            step = steps.get(keyed.unique_id, self.KEYED_DISTANCE)
+            steps[keyed.unique_id] = min(step, self.KEYED_DISTANCE)
+
+        distances = {}
+        for other in self.graph.nodes.values():
+            for phase in other.variants:
+                shown_next = phase is other.value
+                step = steps.get(other.unique_id, float("inf"))
+                distances[id(phase)] = step if shown_next else float("inf")
+
+        return distances
+
+    def _queue(self, order: List[Phase], distances: Dict[int, float]) -> None:
+        """Load the nearest phases that are expected to fit."""
+        known = list(self._sizes.values())
+        average = sum(known) / len(known) if known else None
+        expected = 0
+
+        for phase in order:
+            distance = distances[id(phase)]
+            warm = distance <= self.KEYED_DISTANCE
+
+            if self.max_bytes is not None and not warm:
+                size = self._sizes.get(id(phase), average)
+                if size is None or expected + size > self.max_bytes:
+                    break
+                expected += size
+            else:
+                expected += self._sizes.get(id(phase), average or 0)
+
+            priority = self.loader.KEYED if warm else self.loader.REST
+            if distance <= self.NEIGHBOUR_DISTANCE:
+                priority = self.loader.NEIGHBOUR
+            if distance == 0:
+                priority = self.loader.URGENT
+            self.loader.prioritize([phase], priority)
+
+    def _evict(
+        self, order: List[Phase], distances: Dict[int, float], pinned: set
+    ) -> None:
+        """Unload the farthest phases until the budget holds."""
+        for phase in reversed(order):
+            if self.resident_bytes() <= self.max_bytes:
+                return
+
+            if distances[id(phase)] <= self.KEYED_DISTANCE or id(phase) in pinned:
+                continue
+            if not self._loaded(phase):
+                continue
+
+            self.loader.unload(phase)
+            phase.unload()
+            self.on_unload(phase)
+            self.evictions += 1
+
+    def _loaded(self, phase: Phase) -> bool:
+        return phase.background is not None and self.loader.is_loaded(phase)
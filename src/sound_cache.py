@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import pygame
+
+from decoders import Decoder
+from sources import SourceKey, source_key
+
+"""Decoded sounds shared by every phase and sfx that uses the same file."""
+
+
+class _Entry:
+    def __init__(self) -> None:
+        self.sound: Optional[pygame.mixer.Sound] = None
+        self.error: Optional[BaseException] = None
+        self.ready = threading.Event()
+        self.refs = 0
+        self.nbytes = 0
+        # Whether it stays cached once unreferenced
+        self.retain = False
+
+
+class SoundCache:
+    """
+    Decodes each distinct file once, keyed by resolved path, size and mtime.
+
+    Sounds are reference counted. Once released they stay cached for reuse,
+    and the least recently used unreferenced sounds are evicted when the
+    cache grows past max_bytes. Sounds only ever acquired with retain=False
+    are dropped as soon as they're released, they're only shared while used.
+    """
+
+    MAX_BYTES = 512 * 1024 * 1024
+
+    def __init__(
+        self, max_bytes: int = MAX_BYTES, decoder: Optional[Decoder] = None
+    ) -> None:
+        self.max_bytes = max_bytes
+        self._decoder = decoder or Decoder()
+        self._entries: "OrderedDict[SourceKey, _Entry]" = OrderedDict()
+        self._keys: Dict[int, SourceKey] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by every cached sound, referenced or not."""
+        return self._bytes
+
+    def acquire(self, path: str, retain: bool = True) -> pygame.mixer.Sound:
+        """Return the decoded sound for a file, decoding it on first use."""
+        key = source_key(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _Entry()
+
+            entry.refs += 1
+            entry.retain = entry.retain or retain
+            self._entries.move_to_end(key)
+
+        if not owner:
+            # Another thread may still be decoding the same file
+            entry.ready.wait()
+            if entry.error is not None:
+                raise entry.error
+
+            return entry.sound
+
+        try:
+            entry.sound = self._decoder.sound(path)
+        except BaseException as e:
+            entry.error = e
+            with self._lock:
+                del self._entries[key]
+            raise
+        finally:
+            entry.ready.set()
+
+        with self._lock:
+            entry.nbytes = memoryview(entry.sound).nbytes
+            self._bytes += entry.nbytes
+            self._keys[id(entry.sound)] = key
+            self._evict()
+
+        return entry.sound
+
+    def release(self, sound: pygame.mixer.Sound) -> None:
+        """Drop a reference, the sound stays cached until it's evicted."""
+        with self._lock:
+            key = self._keys.get(id(sound))
+            if key is None:
+                return
+
+            entry = self._entries[key]
+            entry.refs -= 1
+            if entry.refs == 0 and not entry.retain:
+                self._drop(key)
+
+            self._evict()
+
+    def _evict(self) -> None:
+        for key in list(self._entries):
+            if self._bytes <= self.max_bytes:
+                return
+
+            entry = self._entries[key]
+            if entry.refs > 0 or not entry.ready.is_set():
+                continue
+
+            self._drop(key)
+
+    def _drop(self, key: SourceKey) -> None:
+        entry = self._entries.pop(key)
+        del self._keys[id(entry.sound)]
+        self._bytes -= entry.nbytes
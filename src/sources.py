@@ -0,0 +1,181 @@
+import io
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import BinaryIO, Dict, List, Tuple, Union
+
+"""Where asset bytes come from: files on disk, or members of a mounted bundle."""
+
+BUNDLE_MAGIC = b"PHUSIC\x00\x01"
+# Magic, then the length of the JSON header that follows it
+BUNDLE_PREAMBLE = struct.Struct("<8sQ")
+# Members start on a page boundary, so the first read maps whole pages
+BUNDLE_ALIGN = mmap.PAGESIZE
+
+# Paths of bundle members are "<bundle path>!/<member path>"
+MEMBER_SEPARATOR = "!/"
+
+SourceKey = Tuple[str, int, int]
+
+
+class _MemberReader(io.RawIOBase):
+    """A read-only file over a slice of a bundle, without copying it."""
+
+    def __init__(self, view: memoryview) -> None:
+        self._view = view
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self._view[self._position : self._position + len(buffer)]
+        buffer[: len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position}
+        self._position = max(0, base.get(whence, len(self._view)) + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+class Bundle:
+    """
+    A packed config and every asset it uses, mapped into memory.
+
+    The header holds the config, every asset string already resolved to its
+    members, and each member's offset and length. Resolves asset strings like
+    AssetIndex, to member paths, without touching the file system.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.trees: List = []
+
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, length = BUNDLE_PREAMBLE.unpack_from(self._map)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"{path} is not a bundle")
+
+        start = BUNDLE_PREAMBLE.size
+        self.header = json.loads(self._map[start : start + length])
+        self._data = memoryview(self._map)
+        self._data_start = data_start(length)
+
+        # Assets are packed in loading order, read them ahead as they're used
+        if hasattr(self._map, "madvise"):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+
+        stat = os.stat(path)
+        self._version = (stat.st_size, stat.st_mtime_ns)
+        self._resolved = os.path.realpath(path)
+
+    @property
+    def config(self) -> dict:
+        return self.header["config"]
+
+    def to_path(self, asset: str) -> str:
+        """Like AssetIndex.to_path(), for the assets packed in the bundle."""
+        return self._member_path(self._asset(asset)["path"])
+
+    def files(self, asset: str) -> List[str]:
+        return [self._member_path(m) for m in self._asset(asset)["files"]]
+
+    def open(self, member: str) -> BinaryIO:
+        offset, length = self._entry(member)
+        return io.BufferedReader(_MemberReader(self._data[offset : offset + length]))
+
+    def key(self, member: str) -> SourceKey:
+        _, length = self._entry(member)
+        _, mtime = self._version
+        return f"{self._resolved}{MEMBER_SEPARATOR}{member}", length, mtime
+
+    def size(self, member: str) -> int:
+        return self._entry(member)[1]
+
+    def _asset(self, asset: str) -> dict:
+        try:
+            return self.header["assets"][asset]
+        except KeyError:
+            raise FileNotFoundError(f"Asset {asset} not in {self.path}") from None
+
+    def _entry(self, member: str) -> Tuple[int, int]:
+        entry = self.header["members"][member]
+        return self._data_start + entry["offset"], entry["length"]
+
+    def _member_path(self, member: str) -> str:
+        return f"{self.path}{MEMBER_SEPARATOR}{member}"
+
+
+def data_start(header_length: int) -> int:
+    """Where members start, offsets in the header are relative to it."""
+    end = BUNDLE_PREAMBLE.size + header_length
+    return -(-end // BUNDLE_ALIGN) * BUNDLE_ALIGN
+
+
+_bundles: Dict[str, Bundle] = {}
+_lock = threading.Lock()
+
+
+def mount(path: str) -> Bundle:
+    """Open a bundle, its member paths resolve in this process from then on."""
+    with _lock:
+        if path not in _bundles:
+            _bundles[path] = Bundle(path)
+
+        return _bundles[path]
+
+
+def mounted() -> List[str]:
+    """Paths of the mounted bundles, to mount them again in worker processes."""
+    return list(_bundles)
+
+
+def _member(path: str) -> Tuple[Union[Bundle, None], str]:
+    bundle_path, separator, member = path.partition(MEMBER_SEPARATOR)
+    if not separator:
+        return None, path
+
+    bundle = _bundles.get(bundle_path)
+    if bundle is None:
+        raise FileNotFoundError(f"Bundle {bundle_path} is not mounted")
+
+    return bundle, member
+
+
+def open_binary(path: str) -> BinaryIO:
+    """Open a file or bundle member for reading."""
+    bundle, member = _member(path)
+    return open(path, "rb") if bundle is None else bundle.open(member)
+
+
+def loadable(path: str) -> Union[str, BinaryIO]:
+    """What pygame loaders take: the path of a file, or a bundle member open."""
+    bundle, member = _member(path)
+    return path if bundle is None else bundle.open(member)
+
+
+def source_key(path: str) -> SourceKey:
+    """Resolved path, size and mtime, changes whenever the bytes may have."""
+    bundle, member = _member(path)
+    if bundle is not None:
+        return bundle.key(member)
+
+    stat = os.stat(path)
+    return os.path.realpath(path), stat.st_size, stat.st_mtime_ns
+
+
+def source_size(path: str) -> int:
+    bundle, member = _member(path)
+    return os.path.getsize(path) if bundle is None else bundle.size(member)
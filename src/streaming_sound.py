@@ -0,0 +1,289 @@
+import atexit
+import io
+import os
+import threading
+import weakref
+from array import array
+from collections import deque
+from typing import Iterator, Optional, Tuple
+
+import pygame
+
+from sources import open_binary
+
+"""Chunked playback of long mp3 soundtracks, instead of decoding them whole."""
+
+# Layer III bitrates in kbit/s, by MPEG version
+_BITRATES_V1 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+_BITRATES_V2 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+
+# Sample rates by the version bits of the header, 1 is reserved
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+
+
+def _parse_header(data: bytes, i: int) -> Optional[Tuple[int, int, int]]:
+    """Return (frame length, sample rate, samples per frame) of a layer III header."""
+    if i + 4 > len(data) or data[i] != 0xFF or data[i + 1] & 0xE0 != 0xE0:
+        return None
+
+    version = (data[i + 1] >> 3) & 0x03
+    layer = (data[i + 1] >> 1) & 0x03
+    bitrate_index = data[i + 2] >> 4
+    rate_index = (data[i + 2] >> 2) & 0x03
+    padding = (data[i + 2] >> 1) & 0x01
+
+    if version == 1 or layer != 1 or rate_index == 3:
+        return None
+    if bitrate_index in (0, 15):
+        return None
+
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+
+    if version == 3:
+        bitrate = _BITRATES_V1[bitrate_index] * 1000
+        return 144 * bitrate // sample_rate + padding, sample_rate, 1152
+
+    bitrate = _BITRATES_V2[bitrate_index] * 1000
+    return 72 * bitrate // sample_rate + padding, sample_rate, 576
+
+
+def scan_mp3_frames(data: bytes) -> Optional[Tuple[array, int, int]]:
+    """
+    Find the byte offset of every frame in an mp3 file.
+
+    Returns:
+        (offsets, sample rate, samples per frame), where offsets ends with the
+        end of the last frame. None if the data is not a layer III stream.
+    """
+    i = 0
+
+    # Skip an ID3v2 tag, its size is stored as a syncsafe integer
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = 0
+        for b in data[6:10]:
+            size = (size << 7) | (b & 0x7F)
+        i = 10 + size + (10 if data[5] & 0x10 else 0)
+
+    offsets = array("Q")
+    sample_rate = samples_per_frame = 0
+    end = i
+
+    while i < len(data):
+        header = _parse_header(data, i)
+
+        if header is None or i + header[0] > len(data):
+            # Resync on the next frame header, skipping junk and trailing tags
+            i = data.find(b"\xff", i + 1)
+            if i == -1:
+                break
+            continue
+
+        length, rate, spf = header
+        resynced = i != end or not offsets
+        if resynced and i + length < len(data) and not _parse_header(data, i + length):
+            # A lone sync word in junk data, not a frame
+            i += 1
+            continue
+
+        if sample_rate and (rate, spf) != (sample_rate, samples_per_frame):
+            i += 1
+            continue
+
+        sample_rate, samples_per_frame = rate, spf
+        offsets.append(i)
+        i += length
+        end = i
+
+    if not offsets:
+        return None
+
+    offsets.append(end)
+    return offsets, sample_rate, samples_per_frame
+
+
+class StreamingSound:
+    """
+    Stand-in for pygame.mixer.Sound that decodes an mp3 one chunk at a time.
+
+    A feeder thread keeps a small ring of decoded chunks and queues them onto
+    a dedicated channel, so only a few seconds of PCM are resident per track.
+    Supports the subset of the Sound API used for soundtracks: play, stop and
+    volume.
+    """
+
+    CHUNK_FRAMES = 256  # ~6.7 seconds at 44.1 kHz
+    LEAD_IN_FRAMES = 2  # Primes the bit reservoir of a chunk's first frame
+    BUFFERED_CHUNKS = 2
+    POLL_SECONDS = 0.05
+
+    _playing: "weakref.WeakSet[StreamingSound]" = weakref.WeakSet()
+
+    def __init__(self, path: str, frames: Tuple[array, int, int]) -> None:
+        self.path = path
+        self._offsets, self._sample_rate, self._samples_per_frame = frames
+        self._frame_count = len(self._offsets) - 1
+        self._volume = 1.0
+        self._channel: Optional[pygame.mixer.Channel] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._stopped.set()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def open(cls, path: str) -> Optional["StreamingSound"]:
+        """Index an mp3 file for streaming, None if it can't be streamed."""
+        with open_binary(path) as f:
+            frames = scan_mp3_frames(f.read())
+
+        if frames is None:
+            return None
+
+        # Chunks are trimmed by frame count, which is only sample exact when
+        # the mixer plays the file at its own rate. Resampled files click at
+        # every seam, so they're decoded whole instead
+        mixer = pygame.mixer.get_init()
+        if mixer is None or mixer[0] != frames[1]:
+            return None
+
+        return cls(path, frames)
+
+    def play(self, loops: int = 0) -> "StreamingSound":
+        """Start from the beginning, the stream doubles as its own channel."""
+        self.stop()
+
+        self._channel = pygame.mixer.find_channel(True)
+        self._channel.set_volume(self._volume)
+        self._stopped = threading.Event()
+
+        # Decode the first chunk up front so playback starts right away
+        chunks = self._chunks(loops)
+        with open_binary(self.path) as f:
+            self._channel.play(self._decode(f, next(chunks)))
+
+        self._thread = threading.Thread(
+            target=self._feed,
+            args=(self._channel, chunks, self._stopped),
+            daemon=True,
+        )
+        self._thread.start()
+        self._playing.add(self)
+        return self
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopped.set()
+
+            if self._channel is not None:
+                self._channel.stop()
+                self._channel = None
+
+        self._playing.discard(self)
+
+    def _stop(self, channel: pygame.mixer.Channel, stopped: threading.Event) -> None:
+        """Stop one playback from its feeder, unless it was stopped already."""
+        with self._lock:
+            if stopped.is_set():
+                return
+
+            stopped.set()
+            channel.stop()
+            if self._channel is channel:
+                self._channel = None
+                self._playing.discard(self)
+
+    @classmethod
+    def stop_all(cls) -> None:
+        """Stop every stream, feeders must not touch the mixer after it quits."""
+        for sound in list(cls._playing):
+            sound.stop()
+            if sound._thread is not None:
+                sound._thread.join()
+
+    def set_volume(self, value: float) -> None:
+        self._volume = value
+
+        if self._channel is not None:
+            self._channel.set_volume(value)
+
+    def get_volume(self) -> float:
+        return self._volume
+
+    def decoded_chunks(self) -> Iterator[pygame.mixer.Sound]:
+        """Every chunk once, decoded as it's asked for, to queue them elsewhere."""
+        with open_binary(self.path) as f:
+            for chunk in self._chunks(0):
+                yield self._decode(f, chunk)
+
+    def _chunks(self, loops: int) -> Iterator[int]:
+        chunk_count = -(-self._frame_count // self.CHUNK_FRAMES)
+        played = 0
+
+        while loops < 0 or played <= loops:
+            yield from range(chunk_count)
+            played += 1
+
+    def _feed(
+        self,
+        channel: pygame.mixer.Channel,
+        chunks: Iterator[int],
+        stopped: threading.Event,
+    ) -> None:
+        ring = deque()
+
+        try:
+            with open_binary(self.path) as f:
+                while not stopped.is_set():
+                    while len(ring) < self.BUFFERED_CHUNKS:
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            break
+                        ring.append(self._decode(f, chunk))
+
+                    with self._lock:
+                        if stopped.is_set():
+                            break
+                        if not ring and not channel.get_busy():
+                            break
+
+                        # The queued chunk starts the moment the playing one ends
+                        if ring and channel.get_queue() is None:
+                            channel.queue(ring.popleft())
+
+                    stopped.wait(self.POLL_SECONDS)
+        except Exception as e:
+            # E.g. a corrupt frame further in, stop here rather than cut out
+            # once the decoded chunks run out
+            print(f"Stopped streaming {os.path.basename(self.path)}: {e}")
+            self._stop(channel, stopped)
+
+    def _decode(self, f: io.BufferedReader, chunk: int) -> pygame.mixer.Sound:
+        first = chunk * self.CHUNK_FRAMES
+        last = min(first + self.CHUNK_FRAMES, self._frame_count)
+        start = max(first - self.LEAD_IN_FRAMES, 0)
+
+        f.seek(self._offsets[start])
+        data = f.read(self._offsets[last] - self._offsets[start])
+        sound = pygame.mixer.Sound(file=io.BytesIO(data))
+
+        if start == first:
+            return sound
+
+        # Drop the lead-in frames, they only exist to decode the chunk cleanly
+        raw = sound.get_raw()
+        expected = self._pcm_bytes(last - first)
+        if len(raw) <= expected:
+            return sound
+
+        return pygame.mixer.Sound(buffer=raw[-expected:])
+
+    def _pcm_bytes(self, frames: int) -> int:
+        # Streams are played at their own rate, see open()
+        _, size, channels = pygame.mixer.get_init()
+        return frames * self._samples_per_frame * channels * abs(size) // 8
+
+
+atexit.register(StreamingSound.stop_all)
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import pygame
+
+from sources import loadable
+
+"""Rendered HUD text, composited once and reused every frame."""
+
+TextKey = Tuple[str, str, int, int, float]
+
+
+class TextCache:
+    """
+    Outlined text surfaces keyed by (text, font, size, outline width,
+    opacity). The least recently used surfaces are dropped past max_entries.
+    """
+
+    MAX_ENTRIES = 32
+
+    def __init__(self, max_entries: int = MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._surfaces: "OrderedDict[TextKey, pygame.Surface]" = OrderedDict()
+        self._fonts: Dict[Tuple[str, int], pygame.font.Font] = {}
+
+    def font(self, path: str, size: int) -> pygame.font.Font:
+        key = (path, size)
+
+        if key not in self._fonts:
+            self._fonts[key] = pygame.font.Font(loadable(path), size)
+
+        return self._fonts[key]
+
+    def outlined(
+        self,
+        text: str,
+        path: str,
+        size: int,
+        outline_width: int,
+        opacity: float = 1,
+    ) -> pygame.Surface:
+        """
+        White text with a black outline. The outline extends outline_width
+        pixels past the text on every side.
+        """
+        key = (text, path, size, outline_width, opacity)
+        surface = self._surfaces.get(key)
+
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            return surface
+
+        surface = self._render(text, self.font(path, size), outline_width)
+        surface.set_alpha(int(opacity * 255))
+
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.max_entries:
+            self._surfaces.popitem(last=False)
+
+        return surface
+
+    @staticmethod
+    def _render(
+        text: str, font: pygame.font.Font, outline_width: int
+    ) -> pygame.Surface:
+        fill = font.render(text, True, (255, 255, 255))
+
+        # Dilate the glyph mask with a square kernel, that's the outline
+        kernel_size = 2 * outline_width + 1
+        kernel = pygame.mask.Mask((kernel_size, kernel_size), fill=True)
+        outline = pygame.mask.from_surface(fill, 1).convolve(kernel)
+
+        surface = outline.to_surface(setcolor=(0, 0, 0, 255), unsetcolor=(0, 0, 0, 0))
+        surface.blit(fill, (outline_width, outline_width))
+        return surface.convert_alpha()
@@ -1,13 +1,15 @@
+import hashlib
 import os
 from datetime import datetime
-from typing import List
+from typing import TYPE_CHECKING, List
 
-from tabulate import tabulate
+from constants import KEYBIND_FULLSCREEN, PATH_CACHE, PATH_CONTROLS
 
-from constants import KEYBIND_FULLSCREEN, PATH_CONTROLS
-from dataobjects.config_schema import ConfigSchema
-from dataobjects.phase import Phase
-from linked_list import LinkedList
+if TYPE_CHECKING:
+    from dataobjects.config_schema import ConfigSchema
+
+# The config the controls file was last written for
+PATH_CONTROLS_WRITTEN = os.path.join(PATH_CACHE, "controls.sha1")
 
 
 def get_files_from_path(
@@ -58,31 +60,6 @@ def get_files_from_path(
     return sorted(files)
 
 
-def create_linked_list(head: Phase, phases: List[Phase]) -> LinkedList:
-    llist = LinkedList()
-    llist.append(head)
-    added_phases = [head.unique_id]
-
-    while True:
-        next_phase_id = llist.tail.value.next_phase_id
-
-        if next_phase_id in added_phases:
-            # Loop to the already added phase
-            loop_to = llist.get_node(lambda x: x.unique_id == next_phase_id)
-            llist.tail.next = loop_to
-            break
-
-        for phase in phases:
-            if phase.unique_id == next_phase_id:
-                added_phases.append(phase.unique_id)
-                llist.append(phase)
-                break
-        else:
-            break
-
-    return llist
-
-
 def get_local_time():
     now = datetime.now()
     time_as_string = now.strftime("%H:%M")
@@ -116,7 +93,17 @@ def readable_keycode(key: str) -> str:
     return key
 
 
-def generate_controls_file(config: ConfigSchema) -> None:
+def generate_controls_file(config: "ConfigSchema") -> None:
+    """Write the controls file, skipped if it was last written for this config."""
+    fingerprint = hashlib.sha1(config.model_dump_json().encode()).hexdigest()
+    if (
+        os.path.isfile(PATH_CONTROLS)
+        and _read_text(PATH_CONTROLS_WRITTEN) == fingerprint
+    ):
+        return
+
+    from tabulate import tabulate
+
     headers = ["Action", "Key"]
     tablefmt = "github"
 
@@ -143,6 +130,21 @@ def generate_controls_file(config: ConfigSchema) -> None:
         f.write(generate_title_str("Phases") + "\n\n")
         f.write(tabulate(phases, headers, tablefmt) + "\n\n")
 
+    try:
+        os.makedirs(PATH_CACHE, exist_ok=True)
+        with open(PATH_CONTROLS_WRITTEN, "w") as f:
+            f.write(fingerprint)
+    except OSError:
+        pass
+
+
+def _read_text(path: str) -> str:
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return ""
+
 
 def none_or_whitespace(f):
     return f is None or f.isspace()
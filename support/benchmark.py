@@ -0,0 +1,279 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+"""
+Headless benchmarks of loading, drawing, fades and keypresses, per config.
+
+Run from the repository root:
+
+    python support/benchmark.py                    # compare to the baseline
+    python support/benchmark.py --update-baseline  # record a new baseline
+    python support/benchmark.py --require-baseline # fail without a baseline
+
+Every config runs in fresh processes with SDL's dummy video and audio
+drivers, first with an empty cache (cold) and then with the cache the cold
+run filled (warm). Results are written as JSON. Any metric slower than the
+baseline by more than the tolerance fails the run with exit code 1. Without
+a baseline the run passes, unless --require-baseline is given.
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIGS = "configs"
+BASELINE = os.path.join(ROOT, "support", "benchmark_baseline.json")
+OUTPUT = "benchmark.json"
+
+TOLERANCE = 0.25
+# Differences below these are noise, by metric unit
+SLACK = {"_s": 0.25, "_ms": 1.0, "_mb": 10.0}
+# Tail latencies are reported, but too noisy over a few dozen samples to gate on
+UNGATED = ("_p95_ms",)
+
+# ru_maxrss is in bytes on macOS and kilobytes on Linux
+RSS_UNIT = 1024 * 1024 if sys.platform == "darwin" else 1024
+
+FRAMES = 60
+KEYPRESSES = 10
+
+
+def _percentile(samples: List[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[min(int(p / 100 * len(samples)), len(samples) - 1)]
+
+
+def _ms(samples: List[float]) -> Tuple[float, float]:
+    """p50 and p95 in milliseconds."""
+    return _percentile(samples, 50) * 1000, _percentile(samples, 95) * 1000
+
+
+def measure(config_path: str, size: Tuple[int, int], load_only: bool) -> dict:
+    """Load a config in this process and time it, cwd is the game's root."""
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    sys.path.insert(0, os.path.join(ROOT, "src"))
+
+    import pygame
+
+    from config_manager import ConfigManager
+    from decoders import available_cores
+    from phusic import Game
+
+    Game.INITIAL_WINDOW_SIZE = size
+    game = Game(ConfigManager.parse_schema(config_path), workers=available_cores())
+
+    start = time.perf_counter()
+    game._start_loading()
+    for item in game.cm.get_phases() + game.cm.get_sfx():
+        game.cm.loader.wait(item)
+
+    results = {
+        "load_s": time.perf_counter() - start,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / RSS_UNIT,
+    }
+    if load_only:
+        return results
+
+    game._initial_phase()
+
+    def frame() -> float:
+        start = time.perf_counter()
+        game._draw_phase()
+        game._render()
+        return time.perf_counter() - start
+
+    # Steady state, the first frame scales the background
+    frame()
+    results["frame_p50_ms"], results["frame_p95_ms"] = _ms(
+        [frame() for _ in range(FRAMES)]
+    )
+
+    # Crossfade frames, spread over the whole fade
+    fade = []
+    game._change_phase(game.curr_phase.next or game.curr_phase.prev)
+    for i in range(FRAMES):
+        progress = (i % 10 + 0.5) / 10
+        crossfade = game._crossfade
+        crossfade.started_at = time.monotonic() - progress * crossfade.duration
+        fade.append(frame())
+    results["fade_p50_ms"], results["fade_p95_ms"] = _ms(fade)
+
+    # From a keydown in the queue to the first frame of the next phase
+    latency = []
+    for _ in range(KEYPRESSES):
+        game._set_phase(game.graph.head)
+        game._step()
+
+        key = pygame.K_RIGHT if game.curr_phase.next else pygame.K_LEFT
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=key, mod=0))
+
+        start = time.perf_counter()
+        game._step()
+        latency.append(time.perf_counter() - start)
+    results["keypress_p50_ms"], results["keypress_p95_ms"] = _ms(latency)
+
+    return results
+
+
+def run_worker(workdir: str, config: str, size: str, load_only: bool) -> dict:
+    """Measure a config in a new process, so loads and memory start clean."""
+    command = [sys.executable, os.path.abspath(__file__), "--worker", config]
+    command += ["--size", size] + (["--load-only"] if load_only else [])
+
+    process = subprocess.run(command, cwd=workdir, capture_output=True, text=True)
+    if process.returncode != 0:
+        # Killed workers, e.g. out of memory, may not have written anything
+        lines = process.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {process.returncode}"}
+
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def benchmark(config: str, size: str) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        # Fresh working directory, so the first run starts with an empty cache
+        for name in ["assets", CONFIGS]:
+            os.symlink(os.path.join(ROOT, name), os.path.join(workdir, name))
+
+        cold = run_worker(workdir, config, size, load_only=True)
+        if "error" in cold:
+            return cold
+
+        warm = run_worker(workdir, config, size, load_only=False)
+        if "error" in warm:
+            return warm
+
+    results = {"load_cold_s": cold["load_s"], "load_warm_s": warm.pop("load_s")}
+    results.update(warm)
+    return results
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    slower = []
+
+    for config, metrics in results.items():
+        # A config that ran before and fails now is the worst regression,
+        # one skipped in the baseline too, e.g. without its assets, isn't
+        recorded = baseline.get(config, {})
+        if "error" in metrics and recorded and "error" not in recorded:
+            slower.append(f"{config} failed: {metrics['error']}")
+            continue
+
+        for metric, value in metrics.items():
+            before = recorded.get(metric)
+            if not isinstance(before, (int, float)) or metric.endswith(UNGATED):
+                continue
+
+            slack = next((s for u, s in SLACK.items() if metric.endswith(u)), 0)
+            if value > max(before * (1 + tolerance), before + slack):
+                slower.append(f"{config} {metric}: {before:.2f} -> {value:.2f}")
+
+    return slower
+
+
+def print_results(results: dict) -> None:
+    from tabulate import tabulate
+
+    metrics: List[str] = []
+    for values in results.values():
+        metrics += [m for m in values if m not in metrics and m != "error"]
+
+    rows = []
+    for config, values in results.items():
+        if "error" in values:
+            rows.append([config, f"skipped: {values['error']}"])
+        else:
+            rows.append([config] + [f"{values[m]:.2f}" for m in metrics])
+
+    print(tabulate(rows, ["Config"] + metrics, "github"))
+
+
+def main(args: argparse.Namespace) -> int:
+    size = tuple(int(n) for n in args.size.split("x"))
+
+    if args.worker:
+        results = measure(args.worker, size, args.load_only)
+        print(json.dumps(results))
+        return 0
+
+    configs = args.configs or sorted(
+        os.path.join(CONFIGS, f)
+        for f in os.listdir(os.path.join(ROOT, CONFIGS))
+        if f.endswith(".json")
+    )
+
+    results: Dict[str, dict] = {}
+    for config in configs:
+        print(f"Benchmarking {config}", file=sys.stderr)
+        results[os.path.basename(config)] = benchmark(config, args.size)
+
+    print_results(results)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    baseline: Optional[dict] = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if baseline is None:
+        print("\nNo baseline to compare to, record one with --update-baseline")
+        return 1 if args.require_baseline else 0
+
+    missing = [c for c in results if c not in baseline]
+    if missing and args.require_baseline:
+        print("\nNot in the baseline: " + ", ".join(missing))
+        return 1
+
+    slower = regressions(results, baseline, args.tolerance)
+    if slower:
+        print(
+            f"\nFailed or slower than the baseline by more than {args.tolerance:.0%}:"
+        )
+        print("\n".join(slower))
+        return 1
+
+    print("\nNo regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark loading, drawing, fades and keypresses per config."
+    )
+    parser.add_argument("configs", nargs="*", help="Configs to run, all by default")
+    parser.add_argument("--size", default="1920x1080", help="Window size, WxH")
+    parser.add_argument("--output", default=OUTPUT, help="Where to write results")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline to compare")
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store these results as the baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--require-baseline",
+        action="store_true",
+        help="Fail when there's no baseline for a config, instead of passing",
+    )
+    parser.add_argument(
+        "--tolerance",
+        default=TOLERANCE,
+        type=float,
+        help="How much slower than the baseline a metric may be, 0.25 is 25%%",
+    )
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--load-only", action="store_true", help=argparse.SUPPRESS)
+
+    sys.exit(main(parser.parse_args()))